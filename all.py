@@ -1,180 +1,168 @@
+import numpy as np
 import pandas as pd
 
+from attendance_grid import AttendanceGrid
+from attendance_rules import get_rules
+from employee_ids import normalize_ids
+from input_schema import InputSchema
+from instrumentation import count, record
+
+# 通信录、节假日用到的列
+PERSON_SCHEMA = InputSchema(["姓名", "工号", "所在部门"], str_columns=["工号"])
+HOLIDAY_SCHEMA = InputSchema(["日期"])
+
 def init_attendance_template(df, start_date, end_date):
     
     """
-    初始化考勤模板列表（每人每天一条记录）
+    初始化考勤模板（每人每天一条记录，列式存储）
     :param df: 含姓名、工号、所在部门的DataFrame
     :param start_date: 起始日期
     :param end_date: 结束日期
-    :return: 模板列表
+    :return: (AttendanceGrid, 工号 -> 所在部门)
     """
-    if isinstance(df, pd.DataFrame):
-        # 强制工号为字符串类型
-        df["工号"] = df["工号"].astype(str).str.zfill(8)
-        unique_people = df.drop_duplicates(subset=['姓名', '工号'])
-    else:
-        # 如果是字典列表，转换为 DataFrame，再强制工号为字符串
+    if not isinstance(df, pd.DataFrame):
+        # 如果是字典列表，转换为 DataFrame
         df = pd.DataFrame(df)
-        df["工号"] = df["工号"].astype(str).str.zfill(8)
-        unique_people = df.drop_duplicates(subset=['姓名', '工号'])
+    # 工号统一规范（去空白、去 .0 后缀、补足 8 位），与其他来源使用同一规则
+    df["工号"] = normalize_ids(df["工号"])
+    unique_people = df.drop_duplicates(subset=['姓名', '工号'])
 
-    date_range = pd.date_range(start=start_date, end=end_date).date
+    # 列式考勤表按工号寻址，同一工号只保留第一条
+    unique_people = unique_people.drop_duplicates(subset=['工号'])
+    count("duplicate_roster_rows", len(df) - len(unique_people))
 
     person_dept_dict = dict(zip(unique_people["工号"], unique_people["所在部门"]))
 
-    template_records = []
-    for _, person in unique_people.iterrows():
-
-        for date in date_range:
-            template_records.append({
-                "姓名": person["姓名"],
-                "工号": person["工号"],
-                "部门": person.get("所在部门", ""),  # 使用 .get 更健壮
-                "考勤日期": date,
-                "pc出勤状态": "",
-                "oa出勤状态": "",
-                "oa离岗登记": "",
-                "oa请假信息": "",
-                "oa请假类型":"",
-                "oa请假天数": 0,
-                "oa出差信息": "",
-                "oa出差地点": "",
-                "倒班出勤": "",
-                "加班时长": 0,
-                "是否异常": "",
-            })
-    return template_records, person_dept_dict
-
-
-def build_record_index(template_records):
+    grid = AttendanceGrid(unique_people["工号"], unique_people["姓名"], unique_people["所在部门"], start_date, end_date)
+    record(rows_in=len(df), rows_out=grid.n_rows)
+    return grid, person_dept_dict
+
+
+# 请假类型归类：按顺序匹配关键字，第一个命中的为准，都不命中归为 未知请假类型
+LEAVE_BUCKETS = [
+    ("病假", ("病假",)),
+    ("事假", ("事假",)),
+    ("年休假", ("年休假",)),
+    ("婚丧假", ("婚", "丧")),
+    ("探亲假", ("探亲假",)),
+    ("产假", ("产假",)),
+    ("陪产假", ("陪产假",)),
+    ("护理假", ("护理假",)),
+    ("育儿假", ("育儿假",)),
+]
+UNKNOWN_LEAVE_BUCKET = "未知请假类型"
+
+# 汇总表统计列（顺序即导出列顺序）
+SUMMARY_COLUMNS = [
+    "正常出勤天数", "出差", "迟到", "早退", "缺勤", "旷工天数",
+    "病假", "事假", "年休假", "婚丧假", "探亲假", "护理假", "产假", "陪产假", "育儿假", "未知请假类型",
+    "加班时长", "节假日打卡天数", "旷工/请假天数", "登记倒班天数",
+]
+
+# 每日考勤判定结果
+_SKIP, _ABSENT, _TRIP, _LEAVE, _NORMAL, _ABNORMAL, _IGNORED = range(7)
+
+
+def leave_bucket(leave_type):
+    """请假类型 -> 汇总表中的请假列名"""
+    leave_type = str(leave_type)
+    for bucket, keywords in LEAVE_BUCKETS:
+        if any(keyword in leave_type for keyword in keywords):
+            return bucket
+    return UNKNOWN_LEAVE_BUCKET
+
+
+def summarize_attendance(grid, holiday_set, shift_day_dict, rules=None):
     """
-    构建一个 (工号, 日期) -> record 的快速索引
-    :param template_records: 模板记录列表
-    :return: 索引字典
+    按员工汇总考勤结果（按列判定每日结果后按员工分组求和），
+    并将异常标记写回 grid 的 是否异常 列
+    :param grid: AttendanceGrid
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
+    :return: 汇总表 DataFrame（每名员工一行）
     """
-    return {
-        (str(record["工号"]).strip(), record["考勤日期"]): record
-        for record in template_records
-    }
-
-def summarize_attendance(contact_attendance_list, holiday_set, shift_day_dict):
     emp_shift_days = deal_shift(shift_day_dict)
-    summary_map = {}
-    for record in contact_attendance_list:
-        emp_id = str(record.get("工号")).strip().zfill(8)
-        attend_date = record["考勤日期"]
-        oa_leave = record.get("oa请假信息")
-        has_oa_leave = oa_leave is True
-        
-
-        name = record.get("姓名")
-        dept = record.get("部门")
-
-        pc_status = record.get("pc出勤状态")
-        oa_status = record.get("oa出勤状态")
-        oa_leave = record.get("oa请假信息")
-        oa_leave_type = record.get("oa请假类型")
-        oa_leave_days = record.get("oa请假天数")
-        oa_absence = record.get("oa离岗登记")
-        oa_clock = record.get("oa是否打卡")
-        oa_trip = record.get("oa出差信息")
-        shift_attended = record.get("倒班出勤")
-
-
-        if emp_id not in summary_map:
-            summary_map[emp_id] = {
-                "姓名": name,
-                "工号": emp_id,
-                "部门": dept,
-                "正常出勤天数": 0,
-                "出差": 0,
-                "迟到": 0,
-                "早退": 0,
-                "缺勤": 0,
-                "旷工天数": 0,
-                "病假": 0,
-                "事假": 0,
-                "年休假": 0,
-                "婚丧假": 0,
-                "探亲假": 0,
-                "护理假": 0,
-                "产假": 0,
-                "陪产假": 0,
-                "育儿假": 0,
-                "未知请假类型": 0,
-                "加班时长": 0, 
-                "节假日打卡天数": 0,
-                "旷工/请假天数": 0,
-                "登记倒班天数": 0,
-            }
-
-        stat = summary_map[emp_id]
-        
-        is_all_empty = not pc_status and not oa_status and not oa_absence and not oa_leave and not oa_clock and not oa_trip and not shift_attended
-
-
-        is_pc_normal = oa_absence is True or pc_status == "正常出勤"
-        is_oa_normal = oa_status == "正常出勤"
-        
-        has_oa_trip = oa_trip is True
-        is_shift_normal = shift_attended is True  # ✅ 倒班出勤判断
-
-        # 获取员工倒班天数，如果工号不在emp_shift_days中，则默认为0
-        total_shift_days = emp_shift_days.get(emp_id, 0)
-        stat["登记倒班天数"] = total_shift_days
-
-        # 如果考勤日期是节假日且没有OA请假记录，则跳过当前记录
-        if attend_date in holiday_set:
-            if record.get("加班时长", 0) > 0:
-                stat["节假日打卡天数"] += 1
-            if not has_oa_leave and total_shift_days < 9:
-                continue
-        
-
-        
-        if is_all_empty and total_shift_days < 9:
-            stat["旷工天数"] += 1
-            stat["旷工/请假天数"] += 1
-            record["是否异常"] = "是"
-        elif has_oa_trip:
-            stat["出差"] += 1
-        elif has_oa_leave:
-            stat["正常出勤天数"] += 1 - oa_leave_days
-            stat["旷工/请假天数"] += 1
-            if "病假" in oa_leave_type:
-                stat["病假"] += oa_leave_days
-            elif "事假" in oa_leave_type:
-                stat["事假"] += oa_leave_days
-            elif "年休假" in oa_leave_type:
-                stat["年休假"] += oa_leave_days
-            elif "婚" in oa_leave_type or "丧" in oa_leave_type:
-                stat["婚丧假"] += oa_leave_days
-            elif "探亲假" in oa_leave_type:
-                stat["探亲假"] += oa_leave_days
-            elif "产假" in oa_leave_type:
-                stat["产假"] += oa_leave_days
-            elif "陪产假" in oa_leave_type:
-                stat["陪产假"] += oa_leave_days
-            elif "护理假" in oa_leave_type:
-                stat["护理假"] += oa_leave_days
-            elif "育儿假" in oa_leave_type:
-                stat["育儿假"] += oa_leave_days
-            else:
-                stat["未知请假类型"] += oa_leave_days
-        elif is_pc_normal or is_oa_normal or is_shift_normal:
-            stat["正常出勤天数"] += 1
-        else:
-            if total_shift_days < 9:
-                if "迟到" in pc_status:
-                    stat["迟到"] += 1
-                elif "早退" in pc_status:
-                    stat["早退"] += 1
-                else:
-                    stat["缺勤"] += 1
-                record["是否异常"] = "是"
-        stat["加班时长"] += record.get("加班时长", 0)
-    return list(summary_map.values())
+    emp_index = grid.emp_index()
+
+    # 员工级、日期级的判定先按员工/日期计算，再展开到每行；
+    # 倒班天数达到所在单位规则天数（默认 9 天）的员工不统计旷工/迟到/早退/缺勤，节假日也照常统计
+    min_shift_days = (rules or get_rules()).for_employees(grid)["shift_worker_min_days"][:-1]
+    total_shift_days = np.array([emp_shift_days.get(emp_id, 0) for emp_id in grid.emp_ids], dtype=np.int64)
+    is_shift_worker = (total_shift_days >= min_shift_days)[emp_index]
+    is_holiday = np.array([date in holiday_set for date in grid.dates], dtype=bool)[grid.day_index()]
+
+    columns = grid.columns
+    oa_absence = columns["oa离岗登记"]
+    has_oa_leave = columns["oa请假信息"]
+    has_oa_trip = columns["oa出差信息"]
+    is_shift_normal = columns["倒班出勤"]  # ✅ 倒班出勤判断
+    oa_leave_days = columns["oa请假天数"]
+    overtime = columns["加班时长"]
+
+    pc_status = columns["pc出勤状态"]
+    is_pc_normal = oa_absence | grid.matches("pc出勤状态", lambda value: value == "正常出勤")
+    is_oa_normal = grid.matches("oa出勤状态", lambda value: value == "正常出勤")
+    is_all_empty = ((pc_status == 0) & (columns["oa出勤状态"] == 0) & ~oa_absence & ~has_oa_leave
+                    & ~columns["oa是否打卡"] & ~has_oa_trip & ~is_shift_normal)
+
+    # 节假日且没有OA请假记录的非倒班员工跳过当天
+    outcome = np.select(
+        [
+            is_holiday & ~has_oa_leave & ~is_shift_worker,
+            is_all_empty & ~is_shift_worker,
+            has_oa_trip,
+            has_oa_leave,
+            is_pc_normal | is_oa_normal | is_shift_normal,
+            is_shift_worker,
+        ],
+        [_SKIP, _ABSENT, _TRIP, _LEAVE, _NORMAL, _IGNORED],
+        default=_ABNORMAL,
+    )
+    is_leave = outcome == _LEAVE
+    is_abnormal = outcome == _ABNORMAL
+    is_late = is_abnormal & grid.matches("pc出勤状态", lambda value: "迟到" in value)
+    is_early = is_abnormal & ~is_late & grid.matches("pc出勤状态", lambda value: "早退" in value)
+
+    leave_days = np.where(is_leave, oa_leave_days, 0.0)
+    buckets = grid.map_categories("oa请假类型", leave_bucket)
+
+    # 请假天数为空的请假日无法计入正常出勤或请假天数：该员工的 正常出勤天数 与对应请假列显示为空值（与逐行累加时一致），
+    # 便于核对请假记录，不静默丢弃
+    missing_leave_days = is_leave & np.isnan(oa_leave_days)
+    count("missing_leave_days", int(missing_leave_days.sum()))
+
+    contributions = {
+        "正常出勤天数": np.where(outcome == _NORMAL, 1.0, 0.0) + np.where(is_leave, 1 - oa_leave_days, 0.0),
+        "出差": outcome == _TRIP,
+        "迟到": is_late,
+        "早退": is_early,
+        "缺勤": is_abnormal & ~is_late & ~is_early,
+        "旷工天数": outcome == _ABSENT,
+    }
+    for bucket in [name for name, _ in LEAVE_BUCKETS] + [UNKNOWN_LEAVE_BUCKET]:
+        contributions[bucket] = np.where(buckets == bucket, leave_days, 0.0)
+    contributions["加班时长"] = np.where(outcome != _SKIP, overtime, 0)
+    contributions["节假日打卡天数"] = is_holiday & (overtime > 0)
+    contributions["旷工/请假天数"] = (outcome == _ABSENT) | is_leave
+
+    totals = pd.DataFrame(contributions).groupby(emp_index).sum()
+    if missing_leave_days.any():
+        missing = {"正常出勤天数": missing_leave_days}
+        for bucket in [name for name, _ in LEAVE_BUCKETS] + [UNKNOWN_LEAVE_BUCKET]:
+            missing[bucket] = missing_leave_days & (buckets == bucket)
+        missing = pd.DataFrame(missing).groupby(emp_index).any()
+        totals = totals.astype({column: float for column in missing.columns})
+        totals[missing.columns] = totals[missing.columns].mask(missing)
+    totals = totals.reindex(range(grid.n_emps), fill_value=0)
+    totals["登记倒班天数"] = total_shift_days
+
+    # 异常标记批量写回
+    columns["是否异常"] |= (outcome == _ABSENT) | is_abnormal
+
+    summary = pd.DataFrame({"姓名": grid.names, "工号": grid.emp_ids, "部门": grid.depts})
+    for column in SUMMARY_COLUMNS:
+        summary[column] = totals[column].to_numpy()
+    record(rows_in=grid.n_rows, rows_out=len(summary))
+    return summary
 
 # 处理倒班出勤字典，字典的key是由工号和日期组成的元组
 def deal_shift(shift_day_dict):
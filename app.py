@@ -1,59 +1,47 @@
+import json
+import multiprocessing
 import os
+import queue
+import sys
+import threading
 import time
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 import shutil
-import pandas as pd
-from openpyxl.styles import PatternFill
-from openpyxl import Workbook
-
-from all import build_record_index, init_attendance_template, summarize_attendance
-from processCCKQ import fill_business_trip
-from processLGDJ import fill_leave_registration
-from processPCKQ import fill_pc_attendance, process_pc_attendance
-from processQJDJ import fill_leave_info
-from processShift import fill_shift_attendance
-from processYDKQ import fill_oa_attendance
+
+from startup import HEAVY_MODULES, BackgroundImport, format_import_report, measure_imports, write_probe_output
+
+# pandas、openpyxl 与各处理模块不在此导入：窗口显示后在后台导入，界面先出现
+FILE_KEYS = [
+    ("person", "通信录"), ("oa", "OA打卡"), ("trip", "出差记录"),
+    ("pc", "PC考勤结果"), ("leave", "离岗登记"), ("shift", "倒班记录"),
+    ("qj", "请假记录"), ("holiday", "节假日"), ("record", "PC打卡记录")
+]
+REQUIRED_KEYS = [key for key, _ in FILE_KEYS]
+
+# 工作线程发往界面的事件，由主线程定时取出处理（Tk 控件只在主线程中更新）
+POLL_MS = 100
 
 files = {}
 labels = {}
 status_label = None
+percent_label = None
+progress_bar = None
+start_button = None
+cancel_button = None
+events = queue.Queue()
+monitor = None
+start_time = None
+
+
+def load_processing_stack():
+    """导入分析所需的全部组件（在后台线程中执行）"""
+    import input_cache  # noqa: F401
+    import instrumentation  # noqa: F401
+    import pipeline  # noqa: F401
 
-# === 在保存汇总表之前，清理 0 ===
-def clean_zeros(df):
-    return df.applymap(lambda x: "" if (isinstance(x, (int, float)) and x == 0) else x)
-
-# === 保存带颜色标记的Excel文件 ===
-def save_excel_with_highlight(df, file_path):
-    # 创建ExcelWriter对象
-    writer = pd.ExcelWriter(file_path, engine='openpyxl')
-    # 将DataFrame写入Excel
-    df.to_excel(writer, index=False, sheet_name='Sheet1')
-    # 获取工作表对象
-    worksheet = writer.sheets['Sheet1']
-    
-    # 查找'是否异常'列的索引
-    abnormal_col = None
-    for col_idx, col_name in enumerate(df.columns):
-        if col_name == '是否异常':
-            abnormal_col = col_idx + 1  # openpyxl列索引从1开始
-            break
-    
-    # 如果找到'是否异常'列，添加颜色标记
-    if abnormal_col is not None:
-        # 创建填充样式（黄色背景）
-        fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-        
-        # 遍历所有行，标记'是否异常'为'是'的行
-        for row_idx in range(2, len(df) + 2):  # 从第二行开始（第一行是表头）
-            cell = worksheet.cell(row=row_idx, column=abnormal_col)
-            if cell.value == '是':
-                # 标记整行
-                for col in range(1, len(df.columns) + 1):
-                    worksheet.cell(row=row_idx, column=col).fill = fill
-    
-    # 保存文件
-    writer.close()
+
+stack = BackgroundImport(load_processing_stack)
 
 def upload_file(key):
     path = filedialog.askopenfilename(filetypes=[("Excel or CSV files", "*.xlsx *.csv")])
@@ -63,133 +51,190 @@ def upload_file(key):
 
 
 
-def update_status(root, message):
-    status_label.config(text=message)
-    root.update_idletasks()
+def post_status(message):
+    """工作线程中的进度提示：放入事件队列，由主线程显示"""
+    events.put(("status", message))
 
 
 
-def run_analysis(root):
+def clear_directory(base_dir):
+    """清空根目录下的旧文件/文件夹"""
+    for item in os.listdir(base_dir):
+        item_path = os.path.join(base_dir, item)
+        try:
+            if os.path.isfile(item_path) or os.path.islink(item_path):
+                os.remove(item_path)
+            elif os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+        except Exception as e:
+            print(f"清理失败: {item_path}, {e}")
+
+
+
+def analysis_worker(current):
+    """工作线程：等待组件导入完成后执行分析，结果交给主线程选择保存位置"""
+    from instrumentation import Cancelled, monitoring
+
     try:
-        required_keys = ["person", "oa", "trip", "pc", "leave", "shift", "qj", "holiday", "record"]
-        if not all(k in files for k in required_keys):
-            messagebox.showerror("缺少文件", "请确保已选择所有所需文件。")
-            return
-
-        start_time = time.time()
-        update_status(root, "🕐 正在加载数据...")
-
-        person_df = pd.read_excel(files["person"], dtype={"工号": str})
-        oa_df = pd.read_excel(files["oa"], dtype={"编号": str})
-        leave_df = pd.read_excel(files["leave"], dtype={"人员编码": str})
-        qj_df = pd.read_excel(files["qj"], dtype={"工号": str})
-        holiday_df = pd.read_excel(files["holiday"])
-        holiday_set = set(pd.to_datetime(holiday_df["日期"]).dt.date)
-        trip_df = pd.read_excel(files["trip"], dtype={"人员编号": str})
-
-        if files["shift"].endswith(".xlsx"):
-            shift_df = pd.read_excel(files["shift"], dtype={"工号": str})
-        else:
-            shift_df = pd.read_csv(files["shift"], encoding="gbk", dtype={"工号": str})
-
-        if files["record"].endswith(".csv"):
-            record_df = pd.read_csv(files["record"], encoding="gbk", parse_dates=["考勤时间"], dtype={"工号": str})
-        else:
-            record_df = pd.read_excel(files["record"], dtype={"工号": str})
-
-        update_status(root, "📊 正在处理 PC 考勤结果...")
-        date_range, attendance_data = process_pc_attendance(files["pc"])
-        contact_attendance_list, person_dept_dict = init_attendance_template(person_df, date_range[0], date_range[1])
-        index_map = build_record_index(contact_attendance_list)
-
-        fill_pc_attendance(index_map, attendance_data)
-        update_status(root, "📊 正在处理 OA 考勤...")
-        fill_oa_attendance(index_map, oa_df)
-
-        update_status(root, "📊 正在处理离岗登记...")
-        fill_leave_registration(index_map, leave_df)
-        update_status(root, "📊 正在处理请假记录...")
-        print("📊 正在处理请假记录...")
-        fill_leave_info(index_map, qj_df)
-        update_status(root, "📊 正在处理出差记录...")
-        fill_business_trip(index_map, trip_df)
-        update_status(root, "📊 正在处理倒班记录...")
-        shift_day_dict = fill_shift_attendance(index_map, shift_df, record_df, holiday_set, person_dept_dict)
-
-        update_status(root, "📊 正在汇总数据...")
-        summary_result = summarize_attendance(contact_attendance_list, holiday_set, shift_day_dict)
-        df_summary = pd.DataFrame(summary_result)
-        # 打印holiday_set前五条数据
-        # print(holiday_set[:5])
-        df_all = pd.DataFrame(contact_attendance_list)
-
-        update_status(root, "💾 正在保存结果...")
-        save_base = filedialog.asksaveasfilename(title="保存结果文件", defaultextension=".xlsx",
-                                                  filetypes=[("Excel 文件", "*.xlsx")])
-        if save_base:
-            # 根目录
-            base_dir = os.path.dirname(save_base)
-
-            # === 清空根目录下的旧文件/文件夹 ===
-            for item in os.listdir(base_dir):
-                item_path = os.path.join(base_dir, item)
-                try:
-                    if os.path.isfile(item_path) or os.path.islink(item_path):
-                        os.remove(item_path)
-                    elif os.path.isdir(item_path):
-                        shutil.rmtree(item_path)
-                except Exception as e:
-                    print(f"清理失败: {item_path}, {e}")
+        if not stack.ready():
+            post_status("🕐 正在加载分析组件...")
+        stack.wait()
+        from input_cache import InputCache
+        from pipeline import run_pipeline
+
+        with monitoring(current):
+            result = run_pipeline(files, progress=post_status, cache=InputCache())
+        events.put(("analyzed", result))
+    except Cancelled:
+        events.put(("cancelled",))
+    except Exception as e:
+        events.put(("error", str(e)))
 
-            # === 保存新的结果 ===
-            summary_path = os.path.join(base_dir, "所有单位汇总表.xlsx")
-            detail_path = os.path.join(base_dir, "所有单位明细表.xlsx")
-            df_summary = clean_zeros(df_summary)  # 汇总表清理
-            
-            # 使用带颜色标记的保存函数
-            update_status(root, "💾 正在保存带颜色标记的汇总表...")
-            save_excel_with_highlight(df_summary, summary_path)
-            
-            update_status(root, "💾 正在保存带颜色标记的明细表...")
-            save_excel_with_highlight(df_all, detail_path)
-
-            # 创建子目录
-            summary_dir = os.path.join(base_dir, "各单位汇总表")
-            detail_dir = os.path.join(base_dir, "各单位明细表")
-            os.makedirs(summary_dir, exist_ok=True)
-            os.makedirs(detail_dir, exist_ok=True)
-
-            # 按一级部门分组并导出
-            if "部门" in df_summary.columns:
-                dept_groups_summary = df_summary.groupby(df_summary["部门"].astype(str).str.split("/").str[0])
-                dept_groups_detail = df_all.groupby(df_all["部门"].astype(str).str.split("/").str[0])
-
-                for dept, group in dept_groups_summary:
-                    dept_name = str(dept).strip().replace("/", "_").replace("\\", "_")
-                    dept_file = os.path.join(summary_dir, f"{dept_name}_汇总.xlsx")
-                    save_excel_with_highlight(group, dept_file)
-
-                for dept, group in dept_groups_detail:
-                    dept_name = str(dept).strip().replace("/", "_").replace("\\", "_")
-                    dept_file = os.path.join(detail_dir, f"{dept_name}_明细.xlsx")
-                    save_excel_with_highlight(group, dept_file)
-
-                update_status(
-                    root,
-                    f"✅ 已拆分完成，共 {df_summary['部门'].astype(str).str.split('/').str[0].nunique()} 个一级部门"
-                )
 
-        elapsed = time.time() - start_time
-        update_status(root, f"✅ 分析完成，用时 {elapsed:.2f} 秒。")
 
+def export_worker(current, result, base_dir):
+    """工作线程：清空目录并导出结果"""
+    from instrumentation import Cancelled, monitoring, summary_text, write_trace
+    from pipeline import export_results
+
+    try:
+        with monitoring(current):
+            clear_directory(base_dir)
+
+            # === 保存新的结果 ===
+            dept_count = export_results(result, base_dir, progress=post_status)
+            post_status(f"✅ 已拆分完成，共 {dept_count} 个一级部门")
+
+            # 各阶段耗时、行数、未匹配记录与峰值内存，以及各来源不在通信录中的工号
+            write_trace(os.path.join(base_dir, "运行记录.json"), result["timings"],
+                        unmatched_ids=result["unmatched_ids"])
+        events.put(("finished", summary_text(result["timings"])))
+    except Cancelled:
+        events.put(("cancelled",))
     except Exception as e:
-        messagebox.showerror("出错啦", str(e))
-        update_status(root, "❌ 分析失败")
+        events.put(("error", str(e)))
+
+
+
+def run_analysis(root):
+    global monitor, start_time
+    if not all(k in files for k in REQUIRED_KEYS):
+        messagebox.showerror("缺少文件", "请确保已选择所有所需文件。")
+        return
 
+    from instrumentation import RunMonitor
 
+    start_time = time.time()
+    monitor = RunMonitor(on_event=events.put)
+    set_running(True)
+    threading.Thread(target=analysis_worker, args=(monitor,), name="analysis", daemon=True).start()
 
-def main():
-    global status_label
+
+
+def cancel_analysis():
+    """取消：工作线程在下一个检查点（下一块数据、下一个阶段）停止"""
+    if monitor is not None:
+        monitor.cancel()
+        cancel_button.config(state="disabled")
+        status_label.config(text="⏹ 正在取消...")
+
+
+
+def set_running(running):
+    start_button.config(state="disabled" if running else "normal")
+    cancel_button.config(state="normal" if running else "disabled")
+    if not running:
+        progress_bar.stop()
+
+
+
+def show_progress(stage_name, done, total):
+    """按已处理的行数/文件数显示当前阶段的完成百分比；总数未知时显示为滚动进度条"""
+    if not total:
+        show_busy()
+        percent_label.config(text=f"{stage_name or ''} 已处理 {done}")
+        return
+    percent = min(done / total * 100, 100)
+    progress_bar.stop()
+    progress_bar.config(mode="determinate", value=percent)
+    percent_label.config(text=f"{stage_name or ''} {percent:.0f}%")
+
+
+
+def show_busy():
+    if str(progress_bar.cget("mode")) != "indeterminate":
+        progress_bar.config(mode="indeterminate", value=0)
+        progress_bar.start(10)
+
+
+
+def handle_event(root, event):
+    kind = event[0]
+    if kind == "status":
+        status_label.config(text=event[1])
+    elif kind == "stage":
+        # 新的阶段开始：进度条先滚动，收到处理进度后显示百分比
+        show_busy()
+        percent_label.config(text=event[1])
+    elif kind == "advance":
+        show_progress(*event[1:])
+    elif kind == "analyzed":
+        save_results(root, event[1])
+    elif kind == "finished":
+        set_running(False)
+        progress_bar.config(mode="determinate", value=100)
+        percent_label.config(text="")
+        elapsed = time.time() - start_time
+        status_label.config(text=f"✅ 分析完成，用时 {elapsed:.2f} 秒。{event[1]}")
+    elif kind == "cancelled":
+        set_running(False)
+        progress_bar.config(mode="determinate", value=0)
+        percent_label.config(text="")
+        status_label.config(text="⏹ 已取消")
+    elif kind == "error":
+        set_running(False)
+        percent_label.config(text="")
+        messagebox.showerror("出错啦", event[1])
+        status_label.config(text="❌ 分析失败")
+
+
+
+def save_results(root, result):
+    """分析完成后在主线程中选择保存位置，导出在工作线程中执行"""
+    from instrumentation import summary_text
+
+    if monitor.cancelled:
+        handle_event(root, ("cancelled",))
+        return
+    status_label.config(text="💾 正在保存结果...")
+    save_base = filedialog.asksaveasfilename(title="保存结果文件", defaultextension=".xlsx",
+                                              filetypes=[("Excel 文件", "*.xlsx")])
+    if not save_base:
+        handle_event(root, ("finished", summary_text(result["timings"])))
+        return
+    # 根目录
+    base_dir = os.path.dirname(save_base)
+    threading.Thread(target=export_worker, args=(monitor, result, base_dir), name="export", daemon=True).start()
+
+
+
+def poll_events(root):
+    """主线程定时取出工作线程的事件并更新界面"""
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+        handle_event(root, event)
+    root.after(POLL_MS, poll_events, root)
+
+
+
+def main(first_window_probe=None):
+    """
+    :param first_window_probe: 启动基准用的输出文件路径：窗口完成首次绘制后写入绘制完成时刻与已导入的重量级模块并立即退出
+    """
+    global status_label, percent_label, progress_bar, start_button, cancel_button
 
     root = tk.Tk()
     root.title("📊 考勤分析工具 (Tkinter 版)")
@@ -197,13 +242,7 @@ def main():
     frame = tk.Frame(root, padx=12, pady=12)
     frame.pack()
 
-    file_keys = [
-        ("person", "通信录"), ("oa", "OA打卡"), ("trip", "出差记录"),
-        ("pc", "PC考勤结果"), ("leave", "离岗登记"), ("shift", "倒班记录"),
-        ("qj", "请假记录"), ("holiday", "节假日"), ("record", "PC打卡记录")
-    ]
-
-    for key, name in file_keys:
+    for key, name in FILE_KEYS:
         row = tk.Frame(frame)
         row.pack(fill="x", pady=2)
         tk.Label(row, text=name, width=15, anchor="w").pack(side="left")
@@ -211,14 +250,53 @@ def main():
         labels[key].pack(side="left")
         tk.Button(row, text="选择", command=lambda k=key: upload_file(k)).pack(side="left")
 
-    tk.Button(frame, text="🚀 开始分析", bg="#28a745", fg="white",
-              command=lambda: run_analysis(root)).pack(pady=10)
+    buttons = tk.Frame(frame)
+    buttons.pack(pady=10)
+    start_button = tk.Button(buttons, text="🚀 开始分析", bg="#28a745", fg="white",
+                             command=lambda: run_analysis(root))
+    start_button.pack(side="left", padx=4)
+    cancel_button = tk.Button(buttons, text="⏹ 取消", state="disabled", command=cancel_analysis)
+    cancel_button.pack(side="left", padx=4)
+
+    progress_bar = ttk.Progressbar(root, mode="determinate", maximum=100)
+    progress_bar.pack(fill="x", padx=12)
+    percent_label = tk.Label(root, text="", anchor="w")
+    percent_label.pack(fill="x", padx=12)
 
     status_label = tk.Label(root, text="等待操作...", fg="blue", anchor="w")
     status_label.pack(fill="x", padx=12, pady=(0, 12))
 
+    if first_window_probe is not None:
+        root.update()
+        write_probe_output(first_window_probe, json.dumps({
+            "shown_at": time.time(),
+            "eager_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        }))
+        root.destroy()
+        return
+
+    # 窗口显示后再在后台导入分析组件
+    root.after(0, stack.start)
+    root.after(POLL_MS, poll_events, root)
     root.mainloop()
 
 
+def option_value(name):
+    """命令行中 name 之后的参数，未给出时为 None"""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+
 if __name__ == "__main__":
-    main()
+    # PyInstaller 打包后使用进程池需要
+    multiprocessing.freeze_support()
+    if "--import-time" in sys.argv:
+        # 导入耗时测量：逐模块导入分析组件并输出各自耗时（--json 输出 JSON；--output 写入文件，--noconsole 的 exe 须指定）
+        costs = measure_imports()
+        write_probe_output(option_value("--output"), json.dumps(costs) if "--json" in sys.argv else format_import_report(costs))
+    elif "--first-window-probe" in sys.argv:
+        # 启动基准：结果写入其后给出的文件
+        main(first_window_probe=option_value("--first-window-probe"))
+    else:
+        main()
@@ -0,0 +1,329 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from employee_ids import EmployeeIndex
+from instrumentation import record
+
+# 明细字段定义（顺序即导出列顺序），类型说明：
+#   str  : 字符串，按编码存储（int32 编码 + 取值表，空字符串固定为 0）
+#   flag : 布尔标记，导出时 True 显示为 True，False 显示为空
+#   mark : 布尔标记，导出时 True 显示为 "是"，False 显示为空
+#   float/int : 数值
+FIELDS = [
+    ("pc出勤状态", "str"),
+    ("oa出勤状态", "str"),
+    ("oa离岗登记", "flag"),
+    ("oa请假信息", "flag"),
+    ("oa请假类型", "str"),
+    ("oa请假天数", "float"),
+    ("oa出差信息", "flag"),
+    ("oa出差地点", "str"),
+    ("倒班出勤", "flag"),
+    ("加班时长", "int"),
+    ("是否异常", "mark"),
+    ("oa是否打卡", "flag"),
+]
+
+FIELD_TYPES = dict(FIELDS)
+
+_NUMPY_DTYPES = {
+    "str": np.int32,
+    "flag": np.bool_,
+    "mark": np.bool_,
+    "float": np.float64,
+    "int": np.int64,
+}
+
+
+class AttendanceGrid:
+    """
+    员工 × 日期 的列式考勤表：每个字段一个定长数组，
+    第 row = 员工序号 * 天数 + 日期偏移 行对应 (工号, 考勤日期) 一条记录
+    """
+
+    def __init__(self, emp_ids, names, depts, start_date, end_date, employees=None):
+        """
+        :param emp_ids: 本表员工的工号（规范后）
+        :param employees: 通信录 EmployeeIndex；默认以 emp_ids 建立（本表即完整通信录）
+        """
+        self.employees = employees if employees is not None else EmployeeIndex(emp_ids)
+        self.emp_ids = np.asarray(emp_ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.depts = np.asarray(depts, dtype=object)
+        self.dates = np.asarray(pd.date_range(start=start_date, end=end_date).date, dtype=object)
+        self.start = np.datetime64(pd.Timestamp(start_date).date(), "D")
+        self.n_emps = len(self.emp_ids)
+        self.n_days = len(self.dates)
+        self.n_rows = self.n_emps * self.n_days
+
+        # 通信录编码 -> 本表员工序号（最后一位对应编码 -1，恒为 -1）
+        self._code_to_pos = np.full(len(self.employees) + 1, -1, dtype=np.int64)
+        self._code_to_pos[self.employees.codes(self.emp_ids)] = np.arange(self.n_emps)
+
+        # 列块（block）中记录各字段被写入的行，合并时只覆盖这些行；完整考勤表为 None
+        self.written = None
+        self._init_columns([field for field, _ in FIELDS])
+
+    def _init_columns(self, fields):
+        self.columns = {}
+        self.categories = {}
+        self._category_codes = {}
+        for field in fields:
+            kind = FIELD_TYPES[field]
+            self.columns[field] = np.zeros(self.n_rows, dtype=_NUMPY_DTYPES[kind])
+            if kind == "str":
+                self.categories[field] = [""]
+                self._category_codes[field] = {"": 0}
+
+    def __len__(self):
+        return self.n_rows
+
+    # ------------------------------------------------------------------ 定位
+    def row(self, emp_id, date):
+        """单条定位：(工号, datetime.date) -> 行号，不存在返回 -1"""
+        emp_pos = self.emp_positions([emp_id])[0]
+        if emp_pos < 0:
+            return -1
+        offset = (np.datetime64(date, "D") - self.start).astype(np.int64)
+        if offset < 0 or offset >= self.n_days:
+            return -1
+        return emp_pos * self.n_days + int(offset)
+
+    def emp_positions(self, emp_ids, source=None):
+        """
+        批量原始工号 -> 员工序号，不存在为 -1
+        :param source: 来源名称，给出时记录该来源未匹配的工号
+        """
+        return self.positions_for_codes(self.employees.codes(emp_ids, source))
+
+    def positions_for_codes(self, codes):
+        """通信录编码 -> 本表员工序号，不在本表中的为 -1"""
+        return self._code_to_pos[np.asarray(codes, dtype=np.int64)]
+
+    def day_offsets(self, dates):
+        """批量日期 -> 相对报表起始日的天数偏移（可能越界，无效日期为最小 int64）"""
+        days = pd.to_datetime(pd.Series(dates), errors="coerce").to_numpy().astype("datetime64[D]")
+        return (days - self.start).astype(np.int64)
+
+    def locate(self, emp_ids, dates, source=None):
+        """批量定位：原始工号数组 × 日期数组 -> 行号数组，不在表中的为 -1"""
+        return self.rows_for(self.emp_positions(emp_ids, source), self.day_offsets(dates))
+
+    def unmatched_count(self, codes, offsets):
+        """
+        未匹配的记录数：工号不在通信录中（编码为 -1）或日期不在报表范围内
+        按通信录而不是本表判断，增量重算时子表之外的员工不计为未匹配
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        return int(((codes < 0) | (offsets < 0) | (offsets >= self.n_days)).sum())
+
+    def rows_for(self, emp_pos, offsets):
+        """员工序号 × 天数偏移 -> 行号数组，越界的为 -1"""
+        emp_pos = np.asarray(emp_pos, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        valid = (emp_pos >= 0) & (offsets >= 0) & (offsets < self.n_days)
+        return np.where(valid, emp_pos * self.n_days + offsets, -1)
+
+    # ------------------------------------------------------------------ 读写
+    def encode(self, field, values):
+        """字符串字段取值 -> 编码数组（空值按空字符串处理）"""
+        lookup = self._category_codes[field]
+        categories = self.categories[field]
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+        table = np.empty(len(uniques) + 1, dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(categories)
+                categories.append(value)
+            table[i] = code
+        table[-1] = 0  # 缺失值（编码 -1）-> 空字符串
+        return table[codes]
+
+    def set(self, field, rows, values):
+        """
+        批量写入：rows 中为 -1 的行被忽略；同一行出现多次时以最后一次为准
+        :param values: 标量或与 rows 等长的数组
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        scalar = np.ndim(values) == 0
+        if not scalar:
+            values = np.asarray(values, dtype=object if FIELD_TYPES[field] == "str" else None)
+        keep = _last_valid(rows)
+        if not len(keep):
+            return
+        if FIELD_TYPES[field] == "str":
+            values = self.encode(field, [values] if scalar else values[keep])
+            if scalar:
+                values = values[0]
+        elif not scalar:
+            values = values[keep]
+        self.columns[field][rows[keep]] = values
+        if self.written is not None:
+            self.written[field][rows[keep]] = True
+
+    def set_value(self, field, row, value):
+        """单条写入（row 为 -1 时忽略）"""
+        if row < 0:
+            return
+        if FIELD_TYPES[field] == "str":
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                value = ""
+            code = self._category_codes[field].get(value)
+            if code is None:
+                code = self.encode(field, [value])[0]
+            value = code
+        self.columns[field][row] = value
+        if self.written is not None:
+            self.written[field][row] = True
+
+    def values(self, field):
+        """读取字段：字符串字段解码为 object 数组，其余返回底层数组"""
+        column = self.columns[field]
+        if FIELD_TYPES[field] == "str":
+            return np.asarray(self.categories[field], dtype=object)[column]
+        return column
+
+    def matches(self, field, predicate):
+        """字符串字段逐行判断：predicate 对每个不同取值只调用一次"""
+        table = np.array([bool(predicate(value)) for value in self.categories[field]], dtype=bool)
+        return table[self.columns[field]]
+
+    def map_categories(self, field, func, dtype=object):
+        """字符串字段逐行映射：func 对每个不同取值只调用一次"""
+        table = np.array([func(value) for value in self.categories[field]], dtype=dtype)
+        return table[self.columns[field]]
+
+    # ------------------------------------------------------------------ 局部重算
+    def subset(self, emp_positions):
+        """指定员工（按员工序号）组成的空白子表，日期范围与本表相同"""
+        emp_positions = np.asarray(emp_positions, dtype=np.int64)
+        return AttendanceGrid(self.emp_ids[emp_positions], self.names[emp_positions], self.depts[emp_positions],
+                              self.dates[0], self.dates[-1], employees=self.employees)
+
+    def assign(self, emp_positions, sub):
+        """用子表（subset 得到）的全部字段覆盖对应员工的行"""
+        emp_positions = np.asarray(emp_positions, dtype=np.int64)
+        rows = self.rows_for(np.repeat(emp_positions, self.n_days), np.tile(np.arange(self.n_days), len(emp_positions)))
+        for field, kind in FIELDS:
+            if kind == "str":
+                self.set(field, rows, sub.values(field))
+            else:
+                self.columns[field][rows] = sub.columns[field]
+
+    # ------------------------------------------------------------------ 列块
+    def block(self, fields):
+        """
+        只含指定字段的空白列块：与本表共用员工、日期与定位信息，字段数组各自独立，
+        可供多个处理阶段同时写入；访问未声明的字段时报 KeyError
+        """
+        block = copy.copy(self)
+        block._init_columns(fields)
+        block.written = {field: np.zeros(self.n_rows, dtype=bool) for field in fields}
+        return block
+
+    def merge_block(self, block):
+        """将列块中被写入的行覆盖到本表（多个列块按调用顺序合并，后合并的为准）"""
+        for field, written in block.written.items():
+            rows = np.flatnonzero(written)
+            if not len(rows):
+                continue
+            values = block.columns[field][rows]
+            if FIELD_TYPES[field] == "str":
+                values = self.encode(field, block.categories[field])[values]
+            self.columns[field][rows] = values
+            if self.written is not None:
+                self.written[field][rows] = True
+
+    # ------------------------------------------------------------------ 视图
+    def emp_index(self):
+        """每行对应的员工序号"""
+        return np.repeat(np.arange(self.n_emps), self.n_days)
+
+    def day_index(self):
+        """每行对应的日期偏移"""
+        return np.tile(np.arange(self.n_days), self.n_emps)
+
+    def to_frame(self):
+        """
+        导出为明细 DataFrame（列顺序与原明细表一致）
+        字段列直接包装底层数组，不复制数据；姓名/工号/部门/考勤日期为对象引用数组
+        """
+        emp_index = self.emp_index()
+        data = {
+            "姓名": self.names[emp_index],
+            "工号": self.emp_ids[emp_index],
+            "部门": self.depts[emp_index],
+            "考勤日期": self.dates[self.day_index()],
+        }
+        for field, kind in FIELDS:
+            column = self.columns[field]
+            if kind == "str":
+                data[field] = pd.Categorical.from_codes(column, categories=self.categories[field])
+            elif kind == "flag":
+                data[field] = pd.arrays.BooleanArray(column, ~column)
+            elif kind == "mark":
+                data[field] = pd.Categorical.from_codes(column.view(np.int8), categories=["", "是"])
+            else:
+                data[field] = column
+        return pd.DataFrame(data, copy=False)
+
+
+def _last_valid(rows):
+    """返回 rows 中每个有效行号（>=0）最后一次出现的位置，按出现顺序排列"""
+    if not len(rows):
+        return np.empty(0, dtype=np.int64)
+    reversed_rows = rows[::-1]
+    uniques, first_in_reversed = np.unique(reversed_rows, return_index=True)
+    keep = len(rows) - 1 - first_in_reversed[uniques >= 0]
+    keep.sort()
+    return keep
+
+
+def expand_intervals(grid, emp_ids, start_dates, end_dates, source=None):
+    """
+    区间展开：(工号, 开始日期, 结束日期) 表逐日展开为 grid 行号
+    区间先裁剪到报表日期范围；工号不在表中、日期无效或结束早于开始的记录不展开
+    :param source: 来源名称，用于记录未匹配工号
+    :return: (行号数组, 每行对应的源记录序号, 未匹配的记录数)，行号按源记录顺序、日期升序排列；
+             工号不在通信录中、日期无效或区间不在报表范围内的记录计为未匹配（子表之外的员工不计入）
+    """
+    codes = grid.employees.codes(emp_ids, source)
+    emp_pos = grid.positions_for_codes(codes)
+    starts = pd.to_datetime(pd.Series(start_dates), errors="coerce")
+    ends = pd.to_datetime(pd.Series(end_dates), errors="coerce")
+    valid_dates = starts.notna().to_numpy() & ends.notna().to_numpy()
+
+    start_offsets = np.where(valid_dates, grid.day_offsets(starts), 0)
+    end_offsets = np.where(valid_dates, grid.day_offsets(ends), -1)
+    first = np.maximum(start_offsets, 0)
+    last = np.minimum(end_offsets, grid.n_days - 1)
+    in_range = valid_dates & (first <= last)
+    unmatched = int((~in_range | (codes < 0)).sum())
+    lengths = np.where(in_range & (emp_pos >= 0), last - first + 1, 0)
+
+    source = np.repeat(np.arange(len(lengths)), lengths)
+    # 每个展开行在所属区间内的序号
+    step = np.arange(len(source)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    rows = emp_pos[source] * grid.n_days + first[source] + step
+    return rows, source, unmatched
+
+
+def fill_intervals(grid, emp_ids, start_dates, end_dates, payload, source_name=None):
+    """
+    将区间表逐日展开后一次性写入 grid，同一 (工号, 日期) 以后出现的记录为准
+    :param emp_ids: 原始工号（统一由 EmployeeIndex 规范）
+    :param payload: 字段名 -> 标量或与区间表等长的取值
+    :param source_name: 来源名称，用于记录未匹配工号
+    :return: 写入的行号数组
+    """
+    rows, source, unmatched = expand_intervals(grid, emp_ids, start_dates, end_dates, source_name)
+    record(rows_in=len(emp_ids), rows_out=len(rows), unmatched=unmatched)
+    for field, values in payload.items():
+        if np.ndim(values) != 0:
+            values = np.asarray(values)[source]
+        grid.set(field, rows, values)
+    return rows
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# 规则配置文件路径（JSON），不设置时使用 DEFAULT_RULES
+RULES_FILE_ENV = "ATTENDANCE_RULES_FILE"
+
+# 默认考勤规则：defaults 为各单位通用的规则，overrides 按部门/组织名称匹配后逐项覆盖（后面的优先）；
+# 规则内容或 version 变化时规则指纹随之变化，缓存的分析结果与运行状态自动作废
+DEFAULT_RULES = {
+    "version": 1,
+    "defaults": {
+        # OA 打卡：上班打卡须早于该时刻，下班打卡须晚于该时刻
+        "oa_on_duty": "09:00",
+        "oa_off_duty": "18:00",
+        # 工作日最晚打卡超过该时刻的部分计为加班
+        "overtime_start": "18:30",
+        # 招待所：出勤满 full_hours 小时为正常，满 min_hours 小时为缺勤，不足单独标注
+        "guesthouse": False,
+        "guesthouse_full_hours": 8,
+        "guesthouse_min_hours": 7,
+        # PC 考勤结果中的迟到按正常出勤处理
+        "late_as_normal": False,
+        # 倒班天数达到该值的员工不统计旷工/迟到/早退/缺勤，节假日也照常统计
+        "shift_worker_min_days": 9,
+        # 倒班打卡窗口（分钟）：上班 -in_before ~ +in_after，下班 -out_before ~ +out_after
+        "shift_in_before": 240,
+        "shift_in_after": 30,
+        "shift_out_before": 30,
+        "shift_out_after": 240,
+    },
+    "overrides": [
+        # 招待所员工按通信录部门识别
+        {"contains": "招待所", "guesthouse": True},
+        # 武汉分公司按 PC 考勤结果的所属组织识别
+        {"contains": "武汉分公司", "late_as_normal": True},
+    ],
+    # 节假日加班时长统计时排除的门禁读卡器
+    "excluded_places": ["河口1号门入口右2_门_1_读卡器_1_考勤点", "河口-九号门出口_门_1_读卡器_1_考勤点"],
+}
+
+# 以 "HH:MM" 配置、编译为当天分钟数的规则项
+TIME_FIELDS = ["oa_on_duty", "oa_off_duty", "overtime_start"]
+BOOL_FIELDS = ["guesthouse", "late_as_normal"]
+FLOAT_FIELDS = ["guesthouse_full_hours", "guesthouse_min_hours"]
+INT_FIELDS = ["shift_worker_min_days", "shift_in_before", "shift_in_after", "shift_out_before", "shift_out_after"]
+RULE_FIELDS = TIME_FIELDS + BOOL_FIELDS + FLOAT_FIELDS + INT_FIELDS
+
+# 覆盖项的匹配方式：名称以 prefix 开头，或名称包含 contains
+MATCH_KEYS = ("prefix", "contains")
+
+
+def _parse_minute(value, field):
+    """"HH:MM" -> 当天分钟数"""
+    try:
+        hour, minute = str(value).split(":")
+        hour, minute = int(hour), int(minute)
+    except ValueError:
+        raise ValueError(f"规则 {field} 的时间格式应为 HH:MM：{value}")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"规则 {field} 的时间超出范围：{value}")
+    return hour * 60 + minute
+
+
+def _compile_values(values, where):
+    """规则项 -> 编译后的值（时间换算为分钟），并检查规则项名称"""
+    unknown = sorted(set(values) - set(RULE_FIELDS))
+    if unknown:
+        raise ValueError(f"{where} 中存在未知的规则项：{', '.join(unknown)}")
+    compiled = {}
+    for field, value in values.items():
+        if field in TIME_FIELDS:
+            compiled[field] = _parse_minute(value, field)
+        elif field in BOOL_FIELDS:
+            compiled[field] = bool(value)
+        elif field in FLOAT_FIELDS:
+            compiled[field] = float(value)
+        else:
+            compiled[field] = int(value)
+    return compiled
+
+
+class RuleSet:
+    """
+    编译后的考勤规则：按名称（通信录部门或所属组织）批量解析为逐项的规则数组，
+    各处理模块按数组整体计算，不再逐行判断
+    """
+
+    def __init__(self, config):
+        self.version = config.get("version")
+        if self.version is None:
+            raise ValueError("规则配置缺少 version")
+        self.defaults = _compile_values(config.get("defaults", {}), "defaults")
+        missing = [field for field in RULE_FIELDS if field not in self.defaults]
+        if missing:
+            raise ValueError(f"defaults 缺少规则项：{', '.join(missing)}")
+
+        self.overrides = []
+        for i, override in enumerate(config.get("overrides", [])):
+            override = dict(override)
+            matchers = [(key, str(override.pop(key))) for key in MATCH_KEYS if key in override]
+            if len(matchers) != 1:
+                raise ValueError(f"overrides[{i}] 须且只能指定 prefix 或 contains 之一")
+            self.overrides.append((matchers[0], _compile_values(override, f"overrides[{i}]")))
+
+        self.excluded_places = [str(place).strip() for place in config.get("excluded_places", [])]
+        canonical = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        self.fingerprint = f"{self.version}-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+    def _rules_for(self, name):
+        """单个名称 -> 合并覆盖项后的规则"""
+        rules = dict(self.defaults)
+        for (kind, pattern), values in self.overrides:
+            matched = name.startswith(pattern) if kind == "prefix" else pattern in name
+            if matched:
+                rules.update(values)
+        return rules
+
+    def resolve(self, names, default_row=False):
+        """
+        名称数组 -> 规则项 -> 与 names 等长的数组（每个不同的名称只匹配一次）
+        :param default_row: 为 True 时每个数组末尾追加一项默认规则，按 -1 取值即得默认规则
+        """
+        codes, uniques = pd.factorize(pd.Series(names, dtype=object).astype(str).reset_index(drop=True))
+        table = [self._rules_for(name) for name in uniques] + [self.defaults]
+        if default_row:
+            codes = np.append(codes, -1)
+        return {field: np.array([rules[field] for rules in table])[codes] for field in RULE_FIELDS}
+
+    def for_employees(self, grid):
+        """按考勤表员工的部门解析规则；数组按员工序号取值，-1（不在表中）取默认规则"""
+        return self.resolve(grid.depts, default_row=True)
+
+
+def load_rules(path=None):
+    """
+    读取规则配置
+    :param path: JSON 配置文件路径；不指定时读取环境变量 ATTENDANCE_RULES_FILE，均未设置时使用默认规则
+    :return: RuleSet
+    """
+    path = path or os.environ.get(RULES_FILE_ENV)
+    if not path:
+        return RuleSet(DEFAULT_RULES)
+    with open(path, encoding="utf-8") as f:
+        return RuleSet(json.load(f))
+
+
+_active_rules = None
+
+
+def get_rules():
+    """当前生效的规则（进程内只读取、编译一次）"""
+    global _active_rules
+    if _active_rules is None:
+        _active_rules = load_rules()
+    return _active_rules
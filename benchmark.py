@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from pipeline import export_results, find_input_files, run_pipeline
+from sample_data import generate
+from startup import run_startup_benchmark
+
+# 判定为性能回退的阈值：超过基线的比例，以及绝对差值下限（过滤计时抖动）
+DEFAULT_TOLERANCE = 0.25
+MIN_SECONDS_DELTA = 0.05
+MIN_PEAK_MB_DELTA = 5.0
+
+
+def _run_once(files, export_dir=None, workers=1):
+    """执行一次完整流程，返回阶段列表（各阶段打印的提示信息不输出）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_pipeline(files, workers=workers)
+        if export_dir is not None:
+            export_results(result, export_dir, workers=workers)
+    return result["timings"]
+
+
+def run_benchmark(data_dir, repeat=3, memory=True, export=True, workers=1):
+    """
+    对一组输入文件计时（取 repeat 次中每个阶段的最小耗时），并可另做一次内存统计
+    内存统计单独执行一次（tracemalloc 会拖慢计时），各阶段记录 tracemalloc 峰值
+    :return: 阶段名 -> {"seconds": ..., "peak_mb": ...}
+    """
+    files, _ = find_input_files(data_dir)
+    export_dir = tempfile.mkdtemp(prefix="attendance_bench_") if export else None
+    stages = {}
+    try:
+        for _ in range(repeat):
+            for item in _run_once(files, export_dir, workers):
+                entry = stages.setdefault(item["stage"], {})
+                entry["seconds"] = min(entry.get("seconds", float("inf")), item["seconds"])
+
+        if memory:
+            tracemalloc.start()
+            try:
+                for item in _run_once(files, export_dir, workers):
+                    if "peak_mb" in item:
+                        stages.setdefault(item["stage"], {})["peak_mb"] = item["peak_mb"]
+            finally:
+                tracemalloc.stop()
+    finally:
+        if export_dir is not None:
+            shutil.rmtree(export_dir, ignore_errors=True)
+    return stages
+
+
+def compare(stages, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    与基线对比
+    :return: 回退列表 [(阶段, 指标, 基线值, 本次值)]
+    """
+    regressions = []
+    for stage, entry in stages.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        for metric, min_delta in (("seconds", MIN_SECONDS_DELTA), ("peak_mb", MIN_PEAK_MB_DELTA)):
+            if metric not in entry or metric not in base:
+                continue
+            current, previous = entry[metric], base[metric]
+            if current > previous * (1 + tolerance) and current - previous > min_delta:
+                regressions.append((stage, metric, previous, current))
+    return regressions
+
+
+def _load_json(path):
+    if not path or not os.path.exists(path):
+        return {"scenarios": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _print_report(stages, baseline):
+    print(f"{'阶段':<28}{'耗时(s)':>10}{'基线(s)':>10}{'峰值(MB)':>10}{'基线(MB)':>10}")
+    for stage, entry in stages.items():
+        base = baseline.get(stage, {})
+        cells = [entry.get("seconds"), base.get("seconds"), entry.get("peak_mb"), base.get("peak_mb")]
+        print(f"{stage:<28}" + "".join(f"{'-' if value is None else value:>10}" for value in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="考勤分析各阶段性能基准（耗时 + 内存峰值）")
+    parser.add_argument("--data", help="输入目录；不指定则按 -n/-d 生成模拟数据")
+    parser.add_argument("-n", "--employees", type=int, default=1000, help="模拟数据员工数，默认 1000")
+    parser.add_argument("-d", "--days", type=int, default=31, help="模拟数据天数，默认 31")
+    parser.add_argument("--punches-per-day", type=int, default=3, help="模拟数据每人每天平均打卡次数，默认 3")
+    parser.add_argument("--scenario", help="场景名（基线按场景保存），默认 <员工数>x<天数> 或输入目录名")
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数，取最小值，默认 3")
+    parser.add_argument("--workers", type=int, default=1, help="读取、导出进程数，默认 1（便于对比）")
+    parser.add_argument("--no-memory", action="store_true", help="不统计内存峰值")
+    parser.add_argument("--no-export", action="store_true", help="不计入导出阶段")
+    parser.add_argument("--baseline", help="基线 JSON；给出时与基线对比，发现回退返回非零退出码")
+    parser.add_argument("--save-baseline", help="将本次结果写入（合并到）该基线 JSON")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="回退阈值比例，默认 0.25")
+    parser.add_argument("--json-out", help="本次结果输出路径")
+    parser.add_argument("--startup", action="store_true",
+                        help="改为测量界面冷启动：首个窗口显示耗时与逐模块导入耗时（场景名默认 startup）")
+    parser.add_argument("--exe", help="与 --startup 一起使用：测量打包后的可执行文件（如 dist/app/app.exe），默认运行 app.py")
+    args = parser.parse_args(argv)
+
+    eager_modules = []
+    if args.startup:
+        scenario = args.scenario or "startup"
+        try:
+            stages, eager_modules = run_startup_benchmark(repeat=args.repeat, exe=args.exe)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+    else:
+        data_dir = args.data
+        scenario = args.scenario
+        tmp_dir = None
+        if data_dir is None:
+            scenario = scenario or f"{args.employees}x{args.days}"
+            tmp_dir = data_dir = tempfile.mkdtemp(prefix="attendance_data_")
+            print(f"🕐 正在生成模拟数据（{args.employees} 人 × {args.days} 天）...", file=sys.stderr)
+            generate(data_dir, args.employees, args.days, punches_per_day=args.punches_per_day)
+        scenario = scenario or os.path.basename(os.path.normpath(data_dir))
+
+        try:
+            stages = run_benchmark(data_dir, repeat=args.repeat, memory=not args.no_memory,
+                                   export=not args.no_export, workers=args.workers)
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    baseline = _load_json(args.baseline)["scenarios"].get(scenario, {}).get("stages", {})
+    print(f"场景：{scenario}")
+    _print_report(stages, baseline)
+
+    report = {"scenario": scenario, "stages": stages}
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        saved = _load_json(args.save_baseline)
+        saved["scenarios"][scenario] = {"stages": stages}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=2)
+
+    # 窗口显示前就导入了 pandas 等重量级模块，视为启动回退
+    if eager_modules:
+        print(f"❌ 窗口显示前已导入：{', '.join(eager_modules)}")
+        return 1
+
+    if args.baseline:
+        if not baseline:
+            print(f"⚠️ 基线中没有场景 {scenario}")
+            return 0
+        regressions = compare(stages, baseline, args.tolerance)
+        for stage, metric, previous, current in regressions:
+            print(f"❌ 性能回退：{stage} {metric} {previous} -> {current}")
+        if regressions:
+            return 1
+        print("✅ 未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count
+
+# 工号统一为 8 位（与通信录一致），不足 8 位的纯数字工号左侧补 0
+EMP_ID_WIDTH = 8
+
+_WHITESPACE = re.compile(r"\s+")
+_FLOAT_SUFFIX = re.compile(r"^(\d+)\.0+$")
+
+# 未匹配工号在报告中保留的示例数
+UNMATCHED_EXAMPLES = 10
+
+
+@lru_cache(maxsize=1 << 18)
+def normalize_id(value):
+    """
+    单个原始工号 -> 规范工号（同一原始值只计算一次）：
+    去除所有空白；被识别为数字时去掉 .0 后缀；纯数字补足 8 位；空值为空字符串
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = _WHITESPACE.sub("", str(value))
+    match = _FLOAT_SUFFIX.match(text)
+    if match:
+        text = match.group(1)
+    if text.isdigit():
+        text = text.zfill(EMP_ID_WIDTH)
+    return text
+
+
+def normalize_ids(values):
+    """批量规范工号：先按原始值去重，每个不同的原始值只规范一次"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).reset_index(drop=True))
+    table = np.array([normalize_id(value) for value in uniques] + [""], dtype=object)
+    return table[codes]
+
+
+class EmployeeIndex:
+    """
+    通信录工号 -> 紧凑整数编码（0..n-1，按通信录顺序）
+    各来源的原始工号统一经 normalize_id 规范后查编码，后续的匹配、分组都在整数编码上进行；
+    找不到的工号按来源记录，供核对
+    """
+
+    def __init__(self, roster_ids):
+        self.ids = normalize_ids(roster_ids)
+        self._index = pd.Index(self.ids, dtype=object)
+        if not self._index.is_unique:
+            raise ValueError("通信录工号规范后存在重复")
+        self.unmatched = {}
+        # 多个处理阶段可能在不同线程中同时查编码
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getstate__(self):
+        # 锁不能序列化（运行状态会保存通信录编码），恢复时重建
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def codes(self, values, source=None):
+        """
+        原始工号数组 -> 编码数组（不在通信录中的为 -1）
+        :param source: 来源名称（如 "pc"），给出时记录该来源未匹配的工号
+        """
+        raw_codes, uniques = pd.factorize(pd.Series(values, dtype=object).reset_index(drop=True))
+        normalized = [normalize_id(value) for value in uniques]
+        table = np.append(self._index.get_indexer(pd.Index(normalized, dtype=object)), -1)
+        if source is not None:
+            missing = {emp_id for emp_id, code in zip(normalized, table) if code < 0 and emp_id}
+            if missing:
+                with self._lock:
+                    before = len(self.unmatched.get(source, ()))
+                    self.unmatched.setdefault(source, set()).update(missing)
+                    added = len(self.unmatched[source]) - before
+                count("unmatched_ids", added)
+        return table[raw_codes].astype(np.int64)
+
+    def unmatched_report(self):
+        """各来源未匹配工号：来源 -> {"count": 个数, "examples": 示例}"""
+        return {
+            source: {"count": len(ids), "examples": sorted(ids)[:UNMATCHED_EXAMPLES]}
+            for source, ids in sorted(self.unmatched.items())
+        }
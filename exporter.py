@@ -0,0 +1,230 @@
+import io
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from instrumentation import advance
+
+# 异常行高亮（黄色背景）
+HIGHLIGHT_FILL = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+
+# 表头样式与 pandas.to_excel 保持一致
+_HEADER_FONT = Font(bold=True)
+_HEADER_BORDER = Border(left=Side(style="thin"), right=Side(style="thin"),
+                        top=Side(style="thin"), bottom=Side(style="thin"))
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+
+# === 在保存汇总表之前，清理 0 ===
+def clean_zeros(df):
+    """数值列中的 0 显示为空（按列整体替换）"""
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            df[column] = series.astype(object).where(series.ne(0) | series.isna(), "")
+    return df
+
+
+def _column_values(series):
+    """列 -> 可直接写入单元格的对象数组（空值为 None）"""
+    values = series.to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    return values
+
+
+# === 保存带颜色标记的Excel文件 ===
+def save_excel_with_highlight(df, file_path, sheet_name='Sheet1'):
+    """
+    以只写（流式）模式逐行写出 DataFrame，'是否异常' 为 '是' 的整行通过一条条件格式规则标黄
+    :param file_path: 文件路径或可写的二进制文件对象
+    """
+    columns = [_column_values(df.iloc[:, i]) for i in range(len(df.columns))]
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+
+    header = []
+    for col_name in df.columns:
+        cell = WriteOnlyCell(worksheet, value=str(col_name))
+        cell.font = _HEADER_FONT
+        cell.border = _HEADER_BORDER
+        cell.alignment = _HEADER_ALIGNMENT
+        header.append(cell)
+    worksheet.append(header)
+
+    for row in zip(*columns):
+        worksheet.append(row)
+
+    # 如果找到'是否异常'列，添加条件格式（openpyxl列索引从1开始）
+    if '是否异常' in df.columns and len(df) and len(df.columns):
+        abnormal_letter = get_column_letter(list(df.columns).index('是否异常') + 1)
+        cell_range = f"A2:{get_column_letter(len(df.columns))}{len(df) + 1}"
+        worksheet.conditional_formatting.add(
+            cell_range,
+            FormulaRule(formula=[f'${abnormal_letter}2="是"'], fill=HIGHLIGHT_FILL),
+        )
+
+    # 保存文件
+    workbook.save(file_path)
+
+
+def dept_file_name(dept):
+    """一级部门名 -> 可用作文件名的字符串"""
+    return str(dept).strip().replace("/", "_").replace("\\", "_")
+
+
+def first_level_departments(dept_series):
+    """部门列 -> 一级部门列（每个不同的部门字符串只拆分一次）"""
+    codes, uniques = pd.factorize(dept_series.astype(str))
+    first_levels = pd.Index(uniques).str.split("/").str[0].to_numpy(dtype=object)
+    return pd.Series(first_levels[codes], index=dept_series.index)
+
+
+def _department_file_names(depts):
+    """一级部门 -> 文件名前缀；按部门名排序后去重，保证多次运行结果一致"""
+    names = {}
+    used = set()
+    for dept in sorted(depts, key=str):
+        name = base = dept_file_name(dept)
+        suffix = 2
+        while name in used:
+            name = f"{base}({suffix})"
+            suffix += 1
+        used.add(name)
+        names[dept] = name
+    return names
+
+
+def department_workbooks(df_summary, df_all):
+    """
+    按一级部门拆分汇总表、明细表（一级部门只计算一次，两张表共用）
+    :return: (汇总列表, 明细列表)，元素为 (部门文件名前缀, 分组 DataFrame)，按文件名前缀排序
+    """
+    if "部门" not in df_summary.columns:
+        return [], []
+
+    summary_groups = dict(tuple(df_summary.groupby(first_level_departments(df_summary["部门"]), sort=False)))
+    detail_groups = dict(tuple(df_all.groupby(first_level_departments(df_all["部门"]), sort=False)))
+    names = _department_file_names(set(summary_groups) | set(detail_groups))
+
+    summary = []
+    detail = []
+    for dept, name in sorted(names.items(), key=lambda item: item[1]):
+        if dept in summary_groups:
+            summary.append((name, summary_groups[dept]))
+        if dept in detail_groups:
+            detail.append((name, detail_groups[dept]))
+    return summary, detail
+
+
+def export_department_workbooks(df_summary, df_all, summary_dir, detail_dir, workers=None, progress=None,
+                                departments=None):
+    """
+    按一级部门拆分汇总表、明细表并导出，各工作簿在进程池中并行写出
+    :param summary_dir: 各单位汇总表目录，文件名为 <部门>_汇总.xlsx
+    :param detail_dir: 各单位明细表目录，文件名为 <部门>_明细.xlsx
+    :param workers: 进程数；为 1 时在当前进程顺序写出
+    :param progress: 可选回调 progress(已完成数, 总数, 文件名)
+    :param departments: 只重新导出这些一级部门（及目录中缺失文件的部门）；默认全部导出
+    :return: (汇总文件列表, 明细文件列表)，元素为 (部门文件名前缀, 文件路径)，按部门名排序
+    """
+    summary, detail = department_workbooks(df_summary, df_all)
+    summary_files = [(name, os.path.join(summary_dir, f"{name}_汇总.xlsx")) for name, _ in summary]
+    detail_files = [(name, os.path.join(detail_dir, f"{name}_明细.xlsx")) for name, _ in detail]
+
+    tasks = [(group, path) for (_, group), (_, path) in zip(summary + detail, summary_files + detail_files)]
+    if departments is not None and "部门" in df_summary.columns:
+        all_depts = set(first_level_departments(df_summary["部门"])) | set(first_level_departments(df_all["部门"]))
+        names = _department_file_names(all_depts)
+        changed = {names[dept] for dept in departments if dept in names}
+        changed_paths = {path for name, path in summary_files + detail_files if name in changed}
+        tasks = [(group, path) for group, path in tasks if path in changed_paths or not os.path.exists(path)]
+    _run_tasks(save_excel_with_highlight, tasks, workers, progress)
+    return summary_files, detail_files
+
+
+def workbook_bytes(df):
+    """将 DataFrame 导出为 xlsx 文件内容（不落盘）"""
+    buffer = io.BytesIO()
+    save_excel_with_highlight(df, buffer)
+    return buffer.getvalue()
+
+
+def write_results_zip(target, workbooks, extra_files=(), workers=None, progress=None):
+    """
+    将多张表导出为工作簿并直接写入 ZIP（不产生中间文件）
+    工作簿在进程池中并行生成为内存中的 xlsx 内容，再按 workbooks 的顺序写入 ZIP 条目
+    :param target: ZIP 文件路径或可写的二进制文件对象（如 io.BytesIO）
+    :param workbooks: [(ZIP 内路径, DataFrame)]
+    :param extra_files: [(ZIP 内路径, 文件路径)]，从磁盘分块压缩写入（不整体读入内存）
+    :param progress: 可选回调 progress(已完成数, 总数, ZIP 内路径)
+    :return: ZIP 内路径 -> 工作簿内容
+    """
+    tasks = [(df,) for _, df in workbooks]
+    labels = [arcname for arcname, _ in workbooks]
+    contents = _run_tasks(workbook_bytes, tasks, workers, progress, labels)
+
+    # xlsx 本身已是压缩格式，ZIP 内直接存储
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED) as zipf:
+        for arcname, content in zip(labels, contents):
+            zipf.writestr(arcname, content)
+        for arcname, path in extra_files:
+            zipf.write(path, arcname, compress_type=zipfile.ZIP_DEFLATED)
+    return dict(zip(labels, contents))
+
+
+def _run_tasks(func, tasks, workers=None, progress=None, labels=None):
+    """
+    在进程池中执行 func(*task)，大表先执行，结果按 tasks 原顺序返回
+    :param labels: 各任务在进度回调中显示的名称，默认取任务最后一个参数的文件名
+    """
+    total = len(tasks)
+    if labels is None:
+        labels = [os.path.basename(str(task[-1])) for task in tasks]
+    if workers is None:
+        workers = min(total, os.cpu_count() or 1)
+
+    # 大表先执行，减少最后只剩一个进程在忙的时间
+    order = sorted(range(total), key=lambda i: len(tasks[i][0]), reverse=True)
+    results = {}
+    done = 0
+    if workers > 1 and total > 1:
+        try:
+            # 与 loaders.load_inputs 相同：调用方可能是多线程进程（Streamlit、界面的导出线程），固定使用 spawn
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {executor.submit(func, *tasks[i]): i for i in order}
+                try:
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        results[i] = future.result()
+                        done += 1
+                        advance(done, total)
+                        if progress is not None:
+                            progress(done, total, labels[i])
+                except BaseException:
+                    # 出错或取消时不再启动排队中的任务，只等待正在执行的任务结束
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except (OSError, RuntimeError) as e:
+            # 进程池不可用（如受限环境）时退回顺序执行
+            print(f"⚠️ 并行导出失败，改为顺序导出: {e}")
+
+    for i in order:
+        if i in results:
+            continue
+        results[i] = func(*tasks[i])
+        done += 1
+        advance(done, total)
+        if progress is not None:
+            progress(done, total, labels[i])
+    return [results[i] for i in range(total)]
@@ -0,0 +1,177 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# 缓存格式版本：读取逻辑（而非参数）变化时递增，使旧缓存失效
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".attendance_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# 内存中分析结果缓存的默认上限
+DEFAULT_RESULT_MAX_BYTES = int(os.environ.get("ATTENDANCE_RESULT_CACHE_BYTES", 1024 ** 3))
+
+
+class InputCache:
+    """
+    已解析输入文件的本地磁盘缓存
+    键 = 文件内容哈希 + 读取参数 + pandas 版本；值以 pickle 二进制保存（DataFrame 按列块序列化），
+    总大小超过上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("ATTENDANCE_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, input_key, source, options):
+        """计算缓存键：输入类型、读取参数与文件内容共同决定"""
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_VERSION}|{pd.__version__}|{input_key}|{sorted(options.items())!r}|".encode("utf-8"))
+        for block in _iter_content(source):
+            digest.update(block)
+        return f"{input_key}-{digest.hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """读取缓存，返回 (是否命中, 值)"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        # 更新修改时间作为最近使用时间
+        os.utime(path, None)
+        return True, value
+
+    def put(self, key, value):
+        """写入缓存（先写临时文件再替换，避免并发读到半个文件），并按需淘汰"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"⚠️ 写入缓存失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """总大小超过上限时，删除最久未使用的缓存文件"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+def _iter_content(source, block_size=1024 * 1024):
+    """按块读取文件内容（文件路径或上传文件对象）"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                yield block
+    elif isinstance(source, tuple):
+        yield source[1]
+    elif hasattr(source, "getvalue"):
+        yield source.getvalue()
+    else:
+        source.seek(0)
+        yield source.read()
+        source.seek(0)
+
+
+def fingerprint_inputs(files, version):
+    """
+    一组输入文件的指纹：输入键 + 文件名 + 内容哈希 + 规则版本
+    :param files: key -> 文件路径或上传文件对象
+    :param version: 考勤规则版本，规则变化后旧结果不再命中
+    """
+    digest = hashlib.sha256(f"{version}|".encode("utf-8"))
+    for key in sorted(files):
+        content = hashlib.sha256()
+        for block in _iter_content(files[key]):
+            content.update(block)
+        name = os.path.basename(str(getattr(files[key], "name", files[key])))
+        digest.update(f"{key}|{name}|{content.hexdigest()}|".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def estimate_bytes(value):
+    """粗略估计缓存值占用的内存（DataFrame 按列统计，容器递归累加）"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, dict):
+        return sum(estimate_bytes(item) for item in value.values()) + sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_bytes(item) for item in value) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    进程内共享的分析结果缓存（供 Streamlit 各会话共用）
+    键为 fingerprint_inputs 计算的输入指纹；总占用超过上限时淘汰最久未使用的结果，线程安全
+    """
+
+    def __init__(self, max_bytes=DEFAULT_RESULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """读取结果，返回 (是否命中, 值)"""
+        with self._lock:
+            if key not in self._entries:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, self._entries[key][0]
+
+    def put(self, key, value):
+        """
+        写入结果并按需淘汰
+        :return: 是否已缓存；单个结果超过上限时不缓存，返回 False
+        """
+        size = estimate_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return False
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+            return True
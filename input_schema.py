@@ -0,0 +1,121 @@
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+class InputSchema:
+    """
+    输入文件的列声明：处理模块实际用到的列（必需/可选）及按字符串读取的列
+    读取时只解析声明的列（列名去除首尾空白后匹配），表头检查只读取第一行
+    """
+
+    def __init__(self, required, optional=(), str_columns=()):
+        self.required = list(required)
+        self.optional = list(optional)
+        self.columns = self.required + self.optional
+        self.dtype = {column: str for column in str_columns}
+        self._wanted = set(self.columns)
+
+    def usecols(self, column):
+        """read_excel/read_csv 的 usecols：列名去除首尾空白后在声明中"""
+        return str(column).strip() in self._wanted
+
+    def options(self):
+        """读取参数的可序列化描述（作为解析缓存键的一部分，修改声明后旧缓存自动失效）"""
+        return {"columns": self.columns, "dtype": sorted(self.dtype)}
+
+    def read_excel(self, source):
+        return _strip_columns(pd.read_excel(source, usecols=self.usecols, dtype=self.dtype))
+
+    def read_csv(self, source):
+        return _strip_columns(pd.read_csv(source, encoding="gbk", usecols=self.usecols, dtype=self.dtype))
+
+    def read_csv_chunks(self, source, chunksize):
+        """分块读取 CSV，逐块返回"""
+        for chunk in pd.read_csv(source, encoding="gbk", usecols=self.usecols, dtype=self.dtype, chunksize=chunksize):
+            yield _strip_columns(chunk)
+
+    def missing(self, header):
+        """表头中缺少的必需列"""
+        present = {str(column).strip() for column in header}
+        return [column for column in self.required if column not in present]
+
+
+def _strip_columns(df):
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def _is_csv(source):
+    return str(getattr(source, "name", source)).lower().endswith(".csv")
+
+
+def estimate_csv_rows(source, sample_bytes=1 << 20):
+    """
+    按文件大小与开头一段的平均行长估计 CSV 数据行数（只用于显示进度）
+    :return: 估计行数；不是 CSV 或无法读取大小时为 None
+    """
+    if not _is_csv(source):
+        return None
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+        with open(source, "rb") as f:
+            sample = f.read(sample_bytes)
+    elif hasattr(source, "getvalue"):
+        data = source.getvalue()
+        size = len(data)
+        sample = data[:sample_bytes]
+    else:
+        return None
+    lines = sample.count(b"\n")
+    if not lines:
+        return None
+    if len(sample) >= size:
+        return max(lines - 1, 0)
+    return max(int(size * lines / len(sample)) - 1, 0)
+
+
+def read_header(source):
+    """只读取表头：CSV 读第一行，xlsx 以只读方式打开第一个工作表的第一行（与 pandas 默认读取的工作表一致）"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    try:
+        if _is_csv(source):
+            return list(pd.read_csv(source, encoding="gbk", nrows=0).columns)
+        workbook = load_workbook(source, read_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(min_row=1, max_row=1, values_only=True)
+            return [cell for cell in next(rows, ()) if cell is not None]
+        finally:
+            workbook.close()
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+
+def check_headers(files, schemas, labels=None):
+    """
+    读取表头并检查各输入文件是否包含必需列（在任何完整解析之前执行）
+    :param files: key -> 文件路径或上传文件对象
+    :param schemas: key -> InputSchema
+    :param labels: key -> 文件类型名称（用于报告）
+    :return: 问题列表 [(key, 说明)]，全部通过时为空
+    """
+    labels = labels or {}
+    problems = []
+    for key, schema in schemas.items():
+        if key not in files:
+            continue
+        source = files[key]
+        name = os.path.basename(str(getattr(source, "name", source)))
+        label = f"{labels.get(key, key)}（{name}）"
+        try:
+            header = read_header(source)
+        except Exception as e:
+            problems.append((key, f"{label} 无法读取表头：{e}"))
+            continue
+        missing = schema.missing(header)
+        if missing:
+            problems.append((key, f"{label} 缺少列：{', '.join(missing)}"))
+    return problems
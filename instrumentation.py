@@ -0,0 +1,180 @@
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 当前正在执行的阶段（record/count 上报到这里）；不在阶段内时为 None
+_current_stage = ContextVar("current_stage", default=None)
+
+# 当前运行的监视器（进度事件与取消），未设置时为 None
+_monitor = ContextVar("run_monitor", default=None)
+
+
+class Cancelled(Exception):
+    """分析被用户取消"""
+
+
+class RunMonitor:
+    """
+    运行监视：把阶段开始、处理进度事件转发给 on_event，并在这些检查点响应取消
+    事件为元组：("stage", 阶段名) 顶层阶段开始；("advance", 阶段名, 已处理数, 总数或 None)
+    cancel() 可在任意线程调用，正在执行的流程在下一个检查点（下一块数据、下一个阶段）抛出 Cancelled
+    """
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def checkpoint(self, event=None):
+        if self.cancelled:
+            raise Cancelled("分析已取消")
+        if event is not None and self.on_event is not None:
+            self.on_event(event)
+
+
+@contextmanager
+def monitoring(monitor):
+    """在此范围内（含 contextvars 复制到的工作线程）的阶段与进度上报到 monitor"""
+    token = _monitor.set(monitor)
+    try:
+        yield monitor
+    finally:
+        _monitor.reset(token)
+
+
+def _checkpoint(event=None):
+    monitor = _monitor.get()
+    if monitor is not None:
+        monitor.checkpoint(event)
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）；无法获取时返回 None（Windows 需安装 psutil）"""
+    if psutil is not None:
+        peak = getattr(psutil.Process().memory_info(), "peak_wset", None)
+        if peak is not None:
+            return round(peak / 1024 ** 2, 1)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        if sys.platform == "darwin":
+            peak /= 1024
+        return round(peak / 1024, 1)
+    return None
+
+
+@contextmanager
+def stage(timings, name, progress=None, message=None):
+    """
+    记录一个阶段：耗时、CPU 时间、进程峰值内存，以及阶段内通过 record/count 上报的行数与计数；
+    tracemalloc 开启时（如 benchmark.py）同时记录阶段内 Python 内存峰值
+    :param timings: 阶段记录列表，结束时追加本阶段的字典
+    :param progress: 可选回调，阶段开始时接收 message
+    """
+    _checkpoint(("stage", name) if _current_stage.get() is None else None)
+    if progress is not None and message:
+        progress(message)
+    entry = {"stage": name, "seconds": 0.0, "cpu_seconds": 0.0}
+    tracing = tracemalloc.is_tracing()
+    if tracing and hasattr(tracemalloc, "reset_peak"):  # Python 3.9+，3.8 下为累计峰值
+        tracemalloc.reset_peak()
+    token = _current_stage.set(entry)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield entry
+    finally:
+        entry["seconds"] = round(time.perf_counter() - start, 4)
+        entry["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+        _current_stage.reset(token)
+        rss = peak_rss_mb()
+        if rss is not None:
+            entry["peak_rss_mb"] = rss
+        if tracing:
+            entry["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        timings.append(entry)
+
+
+def record(rows_in=None, rows_out=None, unmatched=None):
+    """
+    上报当前阶段的行数（可多次调用，按项累加；不在阶段内时忽略）
+    :param rows_in: 读入的记录数
+    :param rows_out: 写入考勤表/结果的记录数
+    :param unmatched: 因 (工号, 日期) 不在考勤表中而丢弃的记录数
+    """
+    entry = _current_stage.get()
+    if entry is None:
+        return
+    for key, value in (("rows_in", rows_in), ("rows_out", rows_out), ("unmatched", unmatched)):
+        if value is not None:
+            entry[key] = entry.get(key, 0) + int(value)
+
+
+def advance(done, total=None):
+    """
+    上报当前阶段的处理进度（已处理的行数/块数/文件数），同时是取消检查点
+    :param total: 预计总数，未知时为 None
+    """
+    entry = _current_stage.get()
+    _checkpoint(("advance", entry["stage"] if entry is not None else None, int(done), total))
+
+
+def count(name, n=1):
+    """当前阶段的命名计数器（取代逐行打印），不在阶段内时忽略"""
+    entry = _current_stage.get()
+    if entry is None or not n:
+        return
+    counters = entry.setdefault("counters", {})
+    counters[name] = counters.get(name, 0) + int(n)
+
+
+def format_timings(timings):
+    """将阶段记录整理为可写入 JSON 的报告（"load:<key>" 等子项不计入合计）"""
+    stages = [item for item in timings if ":" not in item["stage"]]
+    peaks = [item["peak_rss_mb"] for item in timings if "peak_rss_mb" in item]
+    return {
+        "stages": timings,
+        "total_seconds": round(sum(item["seconds"] for item in stages), 4),
+        "total_cpu_seconds": round(sum(item.get("cpu_seconds", 0) for item in stages), 4),
+        "total_unmatched": sum(item.get("unmatched", 0) for item in stages),
+        "peak_rss_mb": max(peaks) if peaks else None,
+    }
+
+
+def summary_text(timings):
+    """一行概要，供界面状态栏显示"""
+    report = format_timings(timings)
+    text = f"耗时 {report['total_seconds']:.2f} 秒（CPU {report['total_cpu_seconds']:.2f} 秒）"
+    if report["peak_rss_mb"] is not None:
+        text += f"，峰值内存 {report['peak_rss_mb']:.0f} MB"
+    if report["total_unmatched"]:
+        text += f"，未匹配记录 {report['total_unmatched']} 条"
+    return text
+
+
+def write_trace(path, timings, **extra):
+    """将阶段记录写为 JSON 跟踪文件（extra 为附加的报告项，如 unmatched_ids）"""
+    report = format_timings(timings)
+    report.update(extra)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
@@ -0,0 +1,196 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from all import HOLIDAY_SCHEMA, PERSON_SCHEMA
+from input_schema import check_headers
+from instrumentation import advance
+from processCCKQ import TRIP_SCHEMA
+from processLGDJ import LEAVE_SCHEMA
+from processPCKQ import PC_SCHEMA, process_pc_attendance
+from processQJDJ import QJ_SCHEMA
+from processShift import RECORD_SCHEMA, SHIFT_SCHEMA
+from processYDKQ import OA_SCHEMA
+
+
+def file_name(file):
+    """兼容文件路径与 Streamlit 上传文件对象"""
+    return str(getattr(file, "name", file))
+
+
+# === 各输入文件的读取方式 ===
+# 各处理模块声明的列：只解析这些列；声明同时作为解析缓存键的一部分，修改后旧缓存自动失效
+SCHEMAS = {
+    "person": PERSON_SCHEMA,
+    "oa": OA_SCHEMA,
+    "leave": LEAVE_SCHEMA,
+    "qj": QJ_SCHEMA,
+    "holiday": HOLIDAY_SCHEMA,
+    "trip": TRIP_SCHEMA,
+    "shift": SHIFT_SCHEMA,
+    "pc": PC_SCHEMA,
+    "record": RECORD_SCHEMA,
+}
+
+
+def read_person(source):
+    return PERSON_SCHEMA.read_excel(source)
+
+
+def read_oa(source):
+    return OA_SCHEMA.read_excel(source)
+
+
+def read_leave(source):
+    return LEAVE_SCHEMA.read_excel(source)
+
+
+def read_qj(source):
+    return QJ_SCHEMA.read_excel(source)
+
+
+def read_holiday(source):
+    holiday_df = HOLIDAY_SCHEMA.read_excel(source)
+    return set(pd.to_datetime(holiday_df["日期"]).dt.date)
+
+
+def read_trip(source):
+    return TRIP_SCHEMA.read_excel(source)
+
+
+def read_shift(source):
+    if file_name(source).endswith(".xlsx"):
+        return SHIFT_SCHEMA.read_excel(source)
+    return SHIFT_SCHEMA.read_csv(source)
+
+
+def read_pc(source):
+    """PC考勤结果：返回 (日期范围, 精简后的考勤数据)"""
+    return process_pc_attendance(source)
+
+
+# key -> 读取函数；PC打卡记录 体量大，在倒班阶段分块流式读取，不在此列
+READERS = {
+    "person": read_person,
+    "oa": read_oa,
+    "leave": read_leave,
+    "qj": read_qj,
+    "holiday": read_holiday,
+    "trip": read_trip,
+    "shift": read_shift,
+    "pc": read_pc,
+}
+
+
+def _portable(source):
+    """上传文件对象不能跨进程传递，转为 (文件名, 内容) 元组"""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    if hasattr(source, "getvalue"):
+        data = source.getvalue()
+    else:
+        source.seek(0)
+        data = source.read()
+    return (file_name(source), data)
+
+
+def _open_portable(source):
+    if isinstance(source, tuple):
+        name, data = source
+        buffer = io.BytesIO(data)
+        buffer.name = name
+        return buffer
+    return source
+
+
+def _load_one(key, source):
+    """子进程入口：读取单个文件并计时"""
+    start = time.perf_counter()
+    result = READERS[key](_open_portable(source))
+    return key, result, time.perf_counter() - start
+
+
+def _cacheable(key, result):
+    # PC考勤结果 处理失败时返回 (None, None)，不缓存
+    return not (key == "pc" and result[0] is None)
+
+
+def _row_count(result):
+    """读取结果的行数（PC考勤结果为 (日期范围, DataFrame)），无法计数时为 None"""
+    if isinstance(result, tuple):
+        result = result[1]
+    return len(result) if result is not None else None
+
+
+def validate_inputs(files, labels=None):
+    """
+    完整解析前只读取各文件表头，检查处理模块声明的必需列
+    :param labels: key -> 文件类型名称（用于报告）
+    :raises ValueError: 任一文件缺少必需列或无法读取时，报告列出全部问题文件
+    """
+    problems = check_headers(files, SCHEMAS, labels)
+    if problems:
+        raise ValueError("输入文件检查未通过：\n" + "\n".join(f"- {message}" for _, message in problems))
+
+
+def load_inputs(files, keys=None, workers=None, cache=None):
+    """
+    并行读取输入文件（openpyxl 解析为 CPU 密集型，使用进程池）
+    :param files: key -> 文件路径或上传文件对象
+    :param keys: 需要读取的 key，默认 READERS 中全部
+    :param workers: 进程数；为 1 时在当前进程顺序读取
+    :param cache: 可选 InputCache，内容未变的文件直接从缓存读取
+    :return: (key -> 读取结果, 各文件耗时列表 [{"stage": "load:<key>", "seconds": ..., "cached": ..., "rows_out": ...}])
+    """
+    keys = [key for key in (keys or READERS) if key in files]
+
+    results = {}
+    cache_keys = {}
+    if cache is not None:
+        for key in keys:
+            start = time.perf_counter()
+            cache_keys[key] = cache.key(key, files[key], SCHEMAS[key].options())
+            hit, result = cache.get(cache_keys[key])
+            if hit:
+                results[key] = (result, time.perf_counter() - start, True)
+
+    pending = [key for key in keys if key not in results]
+    if workers is None:
+        workers = min(len(pending), os.cpu_count() or 1)
+    if workers > 1 and len(pending) > 1:
+        try:
+            # 调用方（Streamlit、界面的分析线程）已是多线程进程，fork 可能使子进程卡在其他线程持有的锁上，固定使用 spawn
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(_load_one, key, _portable(files[key])) for key in pending]
+                try:
+                    for future in futures:
+                        key, result, seconds = future.result()
+                        results[key] = (result, seconds, False)
+                        advance(len(results), len(keys))
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except (OSError, RuntimeError) as e:
+            # 进程池不可用（如受限环境）时退回顺序读取
+            print(f"⚠️ 并行读取失败，改为顺序读取: {e}")
+
+    for key in pending:
+        if key not in results:
+            _, result, seconds = _load_one(key, files[key])
+            results[key] = (result, seconds, False)
+            advance(len(results), len(keys))
+        if cache is not None and _cacheable(key, results[key][0]):
+            cache.put(cache_keys[key], results[key][0])
+
+    inputs = {key: results[key][0] for key in keys}
+    timings = [
+        {"stage": f"load:{key}", "seconds": round(results[key][1], 4), "cached": results[key][2],
+         "rows_out": _row_count(results[key][0])}
+        for key in keys
+    ]
+    return inputs, timings
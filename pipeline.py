@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import sys
+from functools import partial
+
+import pandas as pd
+
+import loaders
+from attendance_rules import get_rules, load_rules
+from all import init_attendance_template, summarize_attendance
+from exporter import clean_zeros, export_department_workbooks, first_level_departments, save_excel_with_highlight
+from input_cache import InputCache
+from instrumentation import format_timings, record, stage
+from run_state import RunState, global_key
+from stage_scheduler import Stage, run_stages
+from processCCKQ import fill_business_trip
+from processLGDJ import fill_leave_registration
+from processPCKQ import fill_pc_attendance
+from processQJDJ import fill_leave_info
+from processShift import aggregate_punch_records, fill_shift_attendance, shift_employee_codes
+from processYDKQ import fill_oa_attendance
+
+# 文件类型映射：文件名关键字 -> 输入键
+FILE_TYPE_MAPPING = {
+    "通信录": "person",
+    "OA打卡": "oa",
+    "出差记录": "trip",
+    "PC考勤结果": "pc",
+    "离岗登记": "leave",
+    "倒班记录": "shift",
+    "请假记录": "qj",
+    "节假日": "holiday",
+    "PC打卡记录": "record"
+}
+
+REQUIRED_KEYS = ["person", "oa", "trip", "pc", "leave", "shift", "qj", "holiday", "record"]
+
+# 判定逻辑版本：处理代码中的判定逻辑变化时递增
+LOGIC_VERSION = 1
+
+
+def rule_version(rules=None):
+    """判定逻辑版本 + 规则配置指纹：任一变化都使按输入指纹缓存的分析结果与运行状态失效"""
+    return f"{LOGIC_VERSION}|{(rules or get_rules()).fingerprint}"
+
+
+# 当前生效规则对应的版本
+RULE_VERSION = rule_version()
+
+
+def fill_stages(rules):
+    """
+    各填充阶段：声明读取的输入与写入的明细字段；彼此没有依赖，可并发执行，
+    按此顺序合并（倒班阶段中招待所的 pc出勤状态 覆盖 PC 考勤结果）
+    """
+    return [
+        Stage("fill_pc_attendance", partial(fill_pc_attendance, rules=rules), ["pc"], ["pc出勤状态"],
+              "📊 正在处理 PC 考勤结果..."),
+        Stage("fill_oa_attendance", partial(fill_oa_attendance, rules=rules), ["oa"], ["oa出勤状态", "oa是否打卡"],
+              "📊 正在处理 OA 考勤..."),
+        Stage("fill_leave_registration", fill_leave_registration, ["leave"], ["oa离岗登记"],
+              "📊 正在处理离岗登记..."),
+        Stage("fill_leave_info", fill_leave_info, ["qj"], ["oa请假信息", "oa请假类型", "oa请假天数"],
+              "📊 正在处理请假记录..."),
+        Stage("fill_business_trip", fill_business_trip, ["trip"], ["oa出差信息", "oa出差地点"],
+              "📊 正在处理出差记录..."),
+        Stage("fill_shift_attendance", partial(fill_shift_attendance, rules=rules),
+              ["shift", "record", "holiday", "punches"], ["倒班出勤", "加班时长", "pc出勤状态", "是否异常"],
+              "📊 正在处理倒班记录..."),
+    ]
+
+
+def match_input_files(names):
+    """
+    按文件名关键字识别输入文件
+    :param names: 文件名（或带 name 属性的上传文件对象）列表
+    :return: (key -> 文件, 未识别的文件名列表)
+    """
+    files = {}
+    unmatched_files = []
+    for item in names:
+        file_name = os.path.basename(loaders.file_name(item))
+        for keyword, key in FILE_TYPE_MAPPING.items():
+            if keyword in file_name:
+                files[key] = item
+                break
+        else:
+            unmatched_files.append(file_name)
+    return files, unmatched_files
+
+
+def find_input_files(input_dir):
+    """在目录中按文件名关键字查找九个输入文件"""
+    paths = [
+        os.path.join(input_dir, name)
+        for name in sorted(os.listdir(input_dir))
+        if name.lower().endswith((".xlsx", ".csv")) and not name.startswith("~$")
+    ]
+    return match_input_files(paths)
+
+
+def run_pipeline(files, progress=None, workers=None, cache=None, state=None, rules=None):
+    """
+    执行完整考勤分析流程（不含导出）
+    :param files: key -> 文件路径或上传文件对象，需包含 REQUIRED_KEYS
+    :param progress: 可选回调，接收阶段提示文字
+    :param workers: 并行读取输入文件的进程数、并发执行填充阶段的线程数，默认按 CPU 核数
+    :param cache: 可选 InputCache 解析结果缓存
+    :param state: 可选 RunState；给出时只重算输入有变化的员工，并更新保存的运行状态
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
+    :return: 结果字典，含 df_summary、df_all、record_count、各阶段耗时 timings、
+        本次重算涉及的一级部门 changed_departments（全量计算时为 None），
+        以及各来源不在通信录中的工号 unmatched_ids
+    """
+    missing_keys = [key for key in REQUIRED_KEYS if key not in files]
+    if missing_keys:
+        raise ValueError(f"缺少以下必需文件：{', '.join(missing_keys)}")
+
+    rules = rules or get_rules()
+    timings = []
+
+    # 只读表头检查全部输入文件，缺列时在完整解析前即报错
+    with stage(timings, "validate_inputs", progress, "🔍 正在检查输入文件..."):
+        loaders.validate_inputs(files, {key: keyword for keyword, key in FILE_TYPE_MAPPING.items()})
+
+    with stage(timings, "load_inputs", progress, "🕐 正在加载数据..."):
+        inputs, load_timings = loaders.load_inputs(files, workers=workers, cache=cache)
+    timings.extend(load_timings)
+    holiday_set = inputs["holiday"]
+
+    date_range, attendance_data = inputs["pc"]
+    if date_range is None:
+        raise ValueError("PC考勤结果文件处理失败，请检查文件格式")
+
+    with stage(timings, "init_attendance_template"):
+        grid, _ = init_attendance_template(inputs["person"], date_range[0], date_range[1])
+
+    employees = grid.employees
+    shift_codes = shift_employee_codes(inputs["shift"], employees)
+    state_key = None if state is None else global_key(files, date_range, rule_version(rules))
+    with stage(timings, "aggregate_punch_records", progress, "📊 正在汇总打卡记录..."):
+        if state is None:
+            punches = aggregate_punch_records(files["record"], employees, shift_codes, rules=rules)
+        else:
+            punches = state.punches(files["record"], employees, shift_codes, rules, state_key)
+
+    # 增量模式：只为输入有变化的员工建立子表重算，其余员工沿用上次结果
+    positions = None
+    target = grid
+    if state is not None:
+        with stage(timings, "diff_inputs"):
+            positions = state.changed_employees(grid, state_key, inputs, punches)
+        if positions is not None:
+            target = grid.subset(positions)
+            if progress is not None:
+                progress(f"♻️ 输入变化涉及 {len(positions)} 名员工，仅重算这些员工")
+
+    df_summary = None
+    if positions is None or len(positions):
+        # 各填充阶段分别写入自己的列块并发执行，再按声明顺序合并
+        data = dict(inputs, pc=attendance_data, record=files["record"], punches=punches)
+        results = run_stages(target, fill_stages(rules), data, timings, progress=progress, workers=workers)
+        shift_day_dict = results["fill_shift_attendance"]
+
+        with stage(timings, "summarize_attendance", progress, "📊 正在汇总数据..."):
+            df_summary = summarize_attendance(target, holiday_set, shift_day_dict, rules)
+
+    changed_departments = None
+    if state is not None:
+        with stage(timings, "merge_run_state"):
+            grid, df_summary = state.merge(positions, target, df_summary)
+        if positions is not None:
+            changed_departments = sorted(first_level_departments(pd.Series(grid.depts[positions], dtype=object)).unique())
+
+    df_all = grid.to_frame()
+    return {
+        "df_summary": df_summary,
+        "df_all": df_all,
+        "record_count": len(grid),
+        "timings": timings,
+        "changed_departments": changed_departments,
+        "unmatched_ids": employees.unmatched_report(),
+    }
+
+
+def export_results(result, base_dir, progress=None, workers=None):
+    """
+    将分析结果导出到目录：所有单位汇总/明细表 + 各单位汇总表/明细表子目录
+    :param result: run_pipeline 的返回值，导出耗时追加到其 timings
+    :param base_dir: 导出根目录
+    :param progress: 可选回调，接收阶段提示文字
+    :param workers: 并行导出各单位文件的进程数，默认按 CPU 核数
+    :return: 一级部门数量
+    增量结果（changed_departments 不为 None）只重新导出涉及的部门及目录中缺失的部门文件
+    """
+    timings = result.setdefault("timings", [])
+    df_summary = result["df_summary"]
+    df_all = result["df_all"]
+    os.makedirs(base_dir, exist_ok=True)
+
+    with stage(timings, "export_summary", progress, "💾 正在保存带颜色标记的汇总表..."):
+        df_summary = clean_zeros(df_summary)  # 汇总表清理
+        save_excel_with_highlight(df_summary, os.path.join(base_dir, "所有单位汇总表.xlsx"))
+        record(rows_out=len(df_summary))
+    with stage(timings, "export_detail", progress, "💾 正在保存带颜色标记的明细表..."):
+        save_excel_with_highlight(df_all, os.path.join(base_dir, "所有单位明细表.xlsx"))
+        record(rows_out=len(df_all))
+
+    with stage(timings, "export_departments"):
+        summary_dir = os.path.join(base_dir, "各单位汇总表")
+        detail_dir = os.path.join(base_dir, "各单位明细表")
+        os.makedirs(summary_dir, exist_ok=True)
+        os.makedirs(detail_dir, exist_ok=True)
+
+        # 按一级部门分组并导出
+        dept_progress = None
+        if progress is not None:
+            dept_progress = lambda done, total, name: progress(f"💾 正在导出各单位文件 {done}/{total}：{name}")
+        summary_files, _ = export_department_workbooks(df_summary, df_all, summary_dir, detail_dir,
+                                                       workers=workers, progress=dept_progress,
+                                                       departments=result.get("changed_departments"))
+    return len(summary_files)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="考勤分析（命令行批处理版）")
+    parser.add_argument("-i", "--input-dir", help="输入目录，按文件名关键字自动识别九个输入文件")
+    for keyword, key in FILE_TYPE_MAPPING.items():
+        parser.add_argument(f"--{key}", help=f"{keyword}文件路径（覆盖目录识别结果）")
+    parser.add_argument("-o", "--output-dir", help="结果导出目录；不指定则只计算不导出")
+    parser.add_argument("--timing-json", "--trace", help="阶段跟踪报告（耗时、CPU 时间、行数、未匹配记录、峰值内存）JSON 输出路径；不指定则打印到标准输出")
+    parser.add_argument("--workers", type=int, help="并行读取输入文件、导出各单位文件的进程数，默认按 CPU 核数")
+    parser.add_argument("--cache-dir", help="解析结果缓存目录，默认 ~/.attendance_cache")
+    parser.add_argument("--no-cache", action="store_true", help="不使用解析结果缓存")
+    parser.add_argument("--rules", help="考勤规则配置 JSON；不指定时读取环境变量 ATTENDANCE_RULES_FILE，均未设置时使用默认规则")
+    parser.add_argument("--state-dir", help="增量重算的运行状态目录；指定后只重算输入有变化的员工并只重新导出涉及的部门")
+    args = parser.parse_args(argv)
+
+    files = {}
+    if args.input_dir:
+        files, unmatched_files = find_input_files(args.input_dir)
+        for file_name in unmatched_files:
+            print(f"⚠️ 无法识别文件：{file_name}", file=sys.stderr)
+    for key in REQUIRED_KEYS:
+        if getattr(args, key):
+            files[key] = getattr(args, key)
+
+    progress = lambda message: print(message, file=sys.stderr)
+    try:
+        cache = None if args.no_cache else InputCache(args.cache_dir)
+        state = RunState(args.state_dir) if args.state_dir else None
+        rules = load_rules(args.rules)
+        result = run_pipeline(files, progress=progress, workers=args.workers, cache=cache, state=state, rules=rules)
+        if args.output_dir:
+            export_results(result, args.output_dir, progress=progress, workers=args.workers)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    for source, item in result["unmatched_ids"].items():
+        print(f"⚠️ {source}: {item['count']} 个工号不在通信录中，如 {', '.join(item['examples'][:3])}", file=sys.stderr)
+    report = format_timings(result["timings"])
+    report["unmatched_ids"] = result["unmatched_ids"]
+    report = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.timing_json:
+        with open(args.timing_json, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,29 @@
 import pandas as pd
-from datetime import timedelta
-import re
 
-def fill_business_trip(index_map, trip_df):
+from attendance_grid import fill_intervals
+from input_schema import InputSchema
+
+# 出差记录用到的列（缺少出差地点时记为 未知地点）
+TRIP_SCHEMA = InputSchema(["人员编号", "出差开始日期", "出差结束日期"], optional=["出差地点"], str_columns=["人员编号"])
+
+def fill_business_trip(grid, trip_df):
     """
-    根据出差记录更新 index_map 中的考勤数据：标记出差信息（为 True）
-    :param index_map: (工号, 日期) -> record
+    根据出差记录更新 grid 中的考勤数据：标记出差信息（为 True）
+    :param grid: AttendanceGrid 列式考勤表
     :param trip_df: 出差 DataFrame
     """
     # 转换日期格式，非日期值将被转换为 NaT
     trip_df["出差开始日期"] = pd.to_datetime(trip_df["出差开始日期"], errors="coerce")
     trip_df["出差结束日期"] = pd.to_datetime(trip_df["出差结束日期"], errors="coerce")
 
-    for _, row in trip_df.iterrows():
-        # emp_id被错误识别为数字后带了.0后缀
-        emp_id = str(row["人员编号"])
-        emp_id = re.sub(r'\s+', '', emp_id).strip()
-        location = row.get("出差地点", "未知地点")
-
-        # ✅ 校验开始与结束日期
-        if pd.isna(row["出差开始日期"]) or pd.isna(row["出差结束日期"]):
-            # print(f"⚠️ 无效出差记录：工号 {emp_id}，缺少开始或结束日期，已跳过。")
-            continue
-
-        start_date = row["出差开始日期"].date()
-        end_date = row["出差结束日期"].date()
-
-        # 日期逻辑校验（可选）
-        if end_date < start_date:
-            # print(f"⚠️ 异常出差记录：工号 {emp_id} 的结束日期早于开始日期，已跳过。")
-            continue
+    if "出差地点" in trip_df.columns:
+        locations = trip_df["出差地点"].to_numpy(dtype=object)
+    else:
+        locations = "未知地点"
 
-        current_date = start_date
-        while current_date <= end_date:
-            key = (emp_id, current_date)
-            if key in index_map:
-                record = index_map[key]
-                record["oa出差信息"] = True
-                record["oa出差地点"] = location
-                # print(f"❗出差登记表：{emp_id} {current_date} 未找到 key，已跳过")
-            current_date += timedelta(days=1)
+    # 缺少开始或结束日期、结束日期早于开始日期的记录不展开
+    # 工号被识别为数字后带的 .0 后缀由 EmployeeIndex 统一去除
+    fill_intervals(grid, trip_df["人员编号"], trip_df["出差开始日期"], trip_df["出差结束日期"], {
+        "oa出差信息": True,
+        "oa出差地点": locations,
+    }, source_name="trip")
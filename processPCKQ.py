@@ -1,6 +1,13 @@
+import numpy as np
 import pandas as pd
-import re
-from datetime import datetime
+
+from attendance_rules import get_rules
+from input_schema import InputSchema
+from instrumentation import record
+
+# PC考勤结果用到的列
+PC_SCHEMA = InputSchema(['姓名', '工号', '出勤状态', '所属组织', '考勤日期', '上班考勤时间', '下班考勤时间'],
+                        str_columns=['工号'])
 
 def process_pc_attendance(file_path):
     """
@@ -9,17 +16,16 @@ def process_pc_attendance(file_path):
     :return: 日期范围(开始日期,结束日期), 精简后的考勤数据DataFrame
     """
     try:
-        # 读取Excel文件，可能是csv文件
-        df = pd.read_csv(file_path, encoding='gbk')
+        # 读取csv文件，只解析 PC_SCHEMA 声明的列
+        df = PC_SCHEMA.read_csv(file_path)
 
         # 如果文件中不存在目标列名，给出明确提示
-        required_columns = ['姓名', '工号', '出勤状态', '所属组织', '考勤日期', '上班考勤时间', '下班考勤时间']
-        missing_cols = [col for col in required_columns if col not in df.columns]
+        missing_cols = PC_SCHEMA.missing(df.columns)
         if missing_cols:
             raise ValueError(f"缺少必要列：{missing_cols}")
 
         # 提取所需字段
-        df = df[required_columns].copy()
+        df = df[PC_SCHEMA.required].copy()
 
         # 处理考勤日期为datetime格式
         df['考勤日期'] = pd.to_datetime(df['考勤日期'], errors='coerce')
@@ -51,33 +57,29 @@ def get_attendance_data(file_path):
     return attendance_data
 
 # 填充考勤对象的数据
-def fill_pc_attendance(index_map, pc_df):
+def fill_pc_attendance(grid, pc_df, rules=None):
     """
-    将PC考勤数据写入模板
-    :param index_map: (工号, 日期) -> record 的索引
+    将PC考勤数据写入模板（按列整体计算后一次性写入）
+    :param grid: AttendanceGrid 列式考勤表
     :param pc_df: 原始PC考勤DataFrame
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
     :return: None（直接修改记录）
     """
-    for _, row in pc_df.iterrows():
-        # 使用正则表达式去除所有空白字符（空格、制表符、换行符等）
-        emp_id = re.sub(r'\s+', '', str(row["工号"]))
-        date = pd.to_datetime(row["考勤日期"]).date()
-        dept = row["所属组织"]
-        status = row["出勤状态"]
-        start = row["上班考勤时间"]
-        end = row["下班考勤时间"]
-
-        key = (emp_id, date)
-        # if emp_id == "02005006":
-        #     print(f"[DEBUG] 工号{emp_id} 在 {date} 的 start={repr(start)} ({type(start)}), end={repr(end)} ({type(end)})")
-
-        if is_empty_time(start) and is_empty_time(end):
-            if key in index_map:
-                index_map[key]["pc出勤状态"] = ""
-        elif key in index_map:
-            index_map[key]["pc出勤状态"] = status
-            if "武汉分公司" in dept and status == "迟到":
-                index_map[key]["pc出勤状态"] = "正常出勤"
+    if pc_df.empty:
+        return
+    codes = grid.employees.codes(pc_df["工号"], "pc")
+    offsets = grid.day_offsets(pc_df["考勤日期"])
+    rows = grid.rows_for(grid.positions_for_codes(codes), offsets)
+    record(rows_in=len(pc_df), rows_out=(rows >= 0).sum(), unmatched=grid.unmatched_count(codes, offsets))
+
+    # 上下班时间都为空的记录清空出勤状态
+    both_empty = empty_time_mask(pc_df["上班考勤时间"]) & empty_time_mask(pc_df["下班考勤时间"])
+    # 按所属组织匹配规则：迟到按正常出勤处理的单位（如武汉分公司）
+    status = pc_df["出勤状态"]
+    late_as_normal = (rules or get_rules()).resolve(pc_df["所属组织"])["late_as_normal"] & (status == "迟到").to_numpy()
+
+    values = np.where(both_empty, "", np.where(late_as_normal, "正常出勤", status.to_numpy(dtype=object)))
+    grid.set("pc出勤状态", rows, values)
 
 def is_empty_time(val):
     if val is None:
@@ -85,3 +87,7 @@ def is_empty_time(val):
     if isinstance(val, str):
         return val.strip() == ''
     return pd.isna(val)
+
+def empty_time_mask(series):
+    """is_empty_time 的按列版本：空值或去除空白后为空字符串"""
+    return series.isna() | (series.astype(str).str.strip() == "")
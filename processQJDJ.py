@@ -1,32 +1,27 @@
+import numpy as np
 import pandas as pd
-import re
-from datetime import timedelta
 
-def fill_leave_info(index_map, leave_df):
+from attendance_grid import fill_intervals
+from input_schema import InputSchema
+
+# 请假记录用到的列
+QJ_SCHEMA = InputSchema(["工号", "请假开始日期", "请假结束日期", "请假类型新", "请假天数"], str_columns=["工号"])
+
+def fill_leave_info(grid, leave_df):
     """
-    根据请假数据更新 index_map 中的 oa请假信息（为 True）
-    :param index_map: (工号, 日期) -> record
+    根据请假数据更新 grid 中的 oa请假信息（为 True）
+    :param grid: AttendanceGrid 列式考勤表
     :param leave_df: 请假 DataFrame
     """
     # 统一解析日期字段（支持 5/23/25 这种格式）
     leave_df["请假开始日期"] = pd.to_datetime(leave_df["请假开始日期"], errors="coerce")
     leave_df["请假结束日期"] = pd.to_datetime(leave_df["请假结束日期"], errors="coerce")
 
-    for _, row in leave_df.iterrows():
-        # 使用正则表达式去除所有空白字符（空格、制表符、换行符等）
-        emp_id = re.sub(r'\s+', '', str(row["工号"]))
-        start_date = row["请假开始日期"].date()
-        end_date = row["请假结束日期"].date()
-        if pd.isna(row["请假类型新"]):
-            row["请假类型新"] = "请假类型未知"
-
-        current_date = start_date
-        while current_date <= end_date:
-            key = (emp_id, current_date)
-            if key in index_map:
-                record = index_map[key]
-                record["oa请假信息"] = True
-                record["oa请假类型"] = row["请假类型新"]
-                record["oa请假天数"] = 1 if row["请假天数"] >= 1 else row["请假天数"]
+    leave_types = leave_df["请假类型新"].fillna("请假类型未知").to_numpy(dtype=object)
+    leave_days = leave_df["请假天数"].to_numpy(dtype=float)
 
-            current_date += timedelta(days=1)
\ No newline at end of file
+    fill_intervals(grid, leave_df["工号"], leave_df["请假开始日期"], leave_df["请假结束日期"], {
+        "oa请假信息": True,
+        "oa请假类型": leave_types,
+        "oa请假天数": np.where(leave_days >= 1, 1, leave_days),
+    }, source_name="qj")
@@ -1,178 +1,338 @@
+import numpy as np
 import pandas as pd
-import re
-from collections import defaultdict
-from datetime import datetime, timedelta
-import math
 
-def process_shift_attendance(shift_df, punch_dict, index_map):
+from attendance_rules import get_rules
+from employee_ids import normalize_ids
+from input_schema import InputSchema, estimate_csv_rows
+from instrumentation import advance, count, record
+
+
+def parse_datetimes(values):
+    """
+    解析日期时间列，结果与逐值 pd.to_datetime 一致：先整列按推断的格式解析，
+    与推断格式不同而未解析的值再按不同取值逐个解析，无法解析的为 NaT
+    """
+    values = pd.Series(values)
+    parsed = pd.to_datetime(values, errors="coerce")
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        retry_values = values[retry]
+        table = {value: pd.to_datetime(value, errors="coerce") for value in retry_values.unique()}
+        parsed = parsed.where(~retry, pd.to_datetime(retry_values.map(table)))
+    return parsed
+
+
+class PunchIndex:
     """
-    处理倒班人员的出勤记录，并输出关键调试信息
+    打卡时间索引：按 (员工编码, 打卡时间) 排序的 int64 复合键数组
+    键 = 通信录编码 * scale + 相对毫秒数，可对一批员工的时间窗口同时用 searchsorted 计数
     """
-    import traceback
-    shift_day_dict = {}
 
+    def __init__(self, emp_codes, punch_times):
+        emp_codes = np.asarray(emp_codes, dtype=np.int64)
+        punch_times = pd.to_datetime(pd.Series(punch_times).reset_index(drop=True), errors="coerce")
+        valid = punch_times.notna().to_numpy() & (emp_codes >= 0)
+
+        millis = _to_millis(punch_times[valid])
+        self.base = int(millis.min()) if len(millis) else 0
+        offsets = millis - self.base
+        span = int(offsets.max()) + 1 if len(offsets) else 1
+        self.scale = 1 << span.bit_length()
+        self.keys = np.sort(emp_codes[valid] * self.scale + offsets)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def punches(self):
+        """还原为 (编码数组, 毫秒时间戳数组)，按员工、时间排序"""
+        return self.keys // self.scale, self.keys % self.scale + self.base
+
+    def count(self, emp_codes, window_start, window_end):
+        """统计每个员工在 [window_start, window_end] 闭区间内的打卡次数"""
+        codes = np.asarray(emp_codes, dtype=np.int64)
+        lo = np.clip(_to_millis(window_start) - self.base, 0, self.scale - 1)
+        hi = np.clip(_to_millis(window_end) - self.base, -1, self.scale - 1)
+        left = np.searchsorted(self.keys, codes * self.scale + lo, side="left")
+        right = np.searchsorted(self.keys, codes * self.scale + hi, side="right")
+        return np.where((codes >= 0) & (hi >= lo), right - left, 0)
+
+    def count_on_days(self, emp_codes, window_start, window_end, first_day, last_day):
+        """同 count，但只统计落在 first_day 或 last_day 当天（00:00 至 24:00）的打卡"""
+        window_start = _to_millis(window_start)
+        window_end = _to_millis(window_end)
+        first_start = _to_millis(first_day)
+        last_start = _to_millis(last_day)
+        hits = self.count(emp_codes, np.maximum(window_start, first_start),
+                          np.minimum(window_end, first_start + _DAY_MILLIS - 1))
+        last_hits = self.count(emp_codes, np.maximum(window_start, last_start),
+                               np.minimum(window_end, last_start + _DAY_MILLIS - 1))
+        return hits + np.where(last_start != first_start, last_hits, 0)
+
+
+_DAY_MILLIS = 24 * 3600 * 1000
+
+
+def _to_millis(values):
+    """日期时间 -> 毫秒时间戳（int64 数组）；已是 int64 的直接返回"""
+    if isinstance(values, np.ndarray) and values.dtype == np.int64:
+        return values
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype("datetime64[ms]").astype(np.int64)
+
+
+def _expand_days(emp_codes, first_days, last_days):
+    """(员工编码, 起始日, 结束日) -> 逐日展开的 (员工编码, 日期) 数组，结束早于起始的不展开"""
+    lengths = np.maximum((last_days - first_days).astype("timedelta64[D]").astype(np.int64) + 1, 0)
+    source = np.repeat(np.arange(len(lengths)), lengths)
+    step = np.arange(len(source)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return emp_codes[source], first_days[source] + step.astype("timedelta64[D]")
+
+
+def process_shift_attendance(shift_df, punch_index, grid, rules=None):
+    """
+    处理倒班人员的出勤记录：所有班次的上/下班打卡窗口一次性匹配
+    :param punch_index: PunchIndex 打卡时间索引
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
+    :return: (工号, 日期) -> True 的倒班日字典
+    """
     print("🟢 开始处理倒班出勤")
 
-    for idx, row in shift_df.iterrows():
-        try:
-            # 使用正则表达式去除所有空白字符（空格、制表符、换行符等）
-            emp_id = re.sub(r'\s+', '', str(row["工号"]))  # 使用正则表达式去除所有空白字符
-            name = row["姓名"]
-            start_time = pd.to_datetime(row.get("上班时间", ""), errors="coerce")
-            end_time = pd.to_datetime(row.get("下班时间", ""), errors="coerce")
-            # if name == '王艳林':
-            #     print(f"DEBUG: 倒班记录 - 工号={emp_id}, 上班时间={start_time}, 下班时间={end_time}")
-            if not emp_id or pd.isna(start_time) or pd.isna(end_time):
-                print(f"⚠️ 跳过第{idx}行，数据不完整: emp_id={emp_id}, start={start_time}, end={end_time}")
-                continue
-
-            date_key = start_time.date()
-            end_date_key = end_time.date()
-            key = (emp_id, date_key)
-
-            shift_day_dict[key] = True
-            if end_date_key != date_key:
-                shift_day_dict[(emp_id, end_date_key)] = True
-
-            # 合并打卡记录
-            punches_today = punch_dict.get((emp_id, date_key), [])
-            punches_next_day = punch_dict.get((emp_id, end_date_key), [])
-            punch_times = sorted(punches_today + punches_next_day)
-
-            in_start = start_time - timedelta(hours=4)
-            in_end = start_time + timedelta(minutes=30)
-            out_start = end_time - timedelta(minutes=30)
-            out_end = end_time + timedelta(hours=4)
-
-            has_valid_in = any(in_start <= t <= in_end for t in punch_times)
-            has_valid_out = any(out_start <= t <= out_end for t in punch_times)
-
-            if key not in index_map:
-                index_map[key] = {}
-
-            index_map[key]["加班时长"] = 0  # 初始化
-
-            if has_valid_in:
-                if key not in index_map:
-                    index_map[key] = {}
-                index_map[key]["倒班出勤"] = True
-                shift_day_dict[key] = True
-
-            if has_valid_out:
-                end_date_key = end_time.date()
-                end_key = (emp_id, end_date_key)
-                if end_key not in index_map:
-                    index_map[end_key] = {}
-                index_map[end_key]["倒班出勤"] = True
-                shift_day_dict[end_key] = True
-
-            # 从date_key到end_date_key的所有日期都标记为倒班出勤，出去开始和结束
-            current_date = date_key + timedelta(days=1)
-            while current_date < end_date_key:
-                if (emp_id, current_date) not in index_map:
-                    index_map[(emp_id, current_date)] = {}
-                index_map[(emp_id, current_date)]["倒班出勤"] = True
-                shift_day_dict[(emp_id, current_date)] = True
-                current_date += timedelta(days=1)
-
-        except Exception as e:
-            print(f"❌ 错误发生在第{idx}行，员工ID={row.get('工号')}")
-            traceback.print_exc()
-            raise  # 或 return shift_day_dict 提前结束
+    # 工号统一换算为通信录整数编码，不在通信录中的为 -1
+    codes = grid.employees.codes(shift_df["工号"], "shift")
+    start_time = parse_datetimes(shift_df["上班时间"] if "上班时间" in shift_df.columns else pd.Series(pd.NaT, index=shift_df.index))
+    end_time = parse_datetimes(shift_df["下班时间"] if "下班时间" in shift_df.columns else pd.Series(pd.NaT, index=shift_df.index))
+
+    complete = (normalize_ids(shift_df["工号"]) != "") & start_time.notna().to_numpy() & end_time.notna().to_numpy()
+    skipped = int((~complete).sum())
+    count("shift_incomplete_rows", skipped)
+    if skipped:
+        print(f"⚠️ 跳过 {skipped} 行数据不完整的倒班记录")
+
+    valid = complete & (codes >= 0)
+    unmatched = int((complete & (codes < 0)).sum())
+    emp_codes = codes[valid]
+    start_time = start_time[valid].to_numpy().astype("datetime64[ms]")
+    end_time = end_time[valid].to_numpy().astype("datetime64[ms]")
+    start_day = start_time.astype("datetime64[D]")
+    end_day = end_time.astype("datetime64[D]")
+
+    # 只在上班日和下班日两天的打卡中查找，窗口按员工所在单位的规则（默认上班 -4h ~ +30min，下班 -30min ~ +4h）
+    rules = (rules or get_rules()).for_employees(grid)
+    positions = grid.positions_for_codes(emp_codes)
+    window = {field: rules[field][positions].astype("timedelta64[m]")
+              for field in ("shift_in_before", "shift_in_after", "shift_out_before", "shift_out_after")}
+    has_valid_in = punch_index.count_on_days(
+        emp_codes, start_time - window["shift_in_before"], start_time + window["shift_in_after"], start_day, end_day) > 0
+    has_valid_out = punch_index.count_on_days(
+        emp_codes, end_time - window["shift_out_before"], end_time + window["shift_out_after"], start_day, end_day) > 0
+
+    # 上班日、下班日及中间所有日期都登记为倒班日
+    middle_emp, middle_days = _expand_days(emp_codes, start_day + np.timedelta64(1, "D"), end_day - np.timedelta64(1, "D"))
+    shift_emp = np.concatenate([emp_codes, emp_codes, middle_emp])
+    shift_days = np.concatenate([start_day, end_day, middle_days])
+    shift_day_dict = dict.fromkeys(zip(grid.employees.ids[shift_emp], shift_days.astype(object)), True)
+
+    # 上班打卡有效标记上班日，下班打卡有效标记下班日，中间日期直接标记为倒班出勤
+    attended_emp = np.concatenate([emp_codes[has_valid_in], emp_codes[has_valid_out], middle_emp])
+    attended_days = np.concatenate([start_day[has_valid_in], end_day[has_valid_out], middle_days])
+    attended_offsets = grid.day_offsets(attended_days)
+    attended_rows = grid.rows_for(grid.positions_for_codes(attended_emp), attended_offsets)
+    grid.set("倒班出勤", attended_rows, True)
+    record(rows_in=len(shift_df), rows_out=(attended_rows >= 0).sum(),
+           unmatched=unmatched + grid.unmatched_count(attended_emp, attended_offsets))
 
     print("🟢 倒班出勤处理完毕")
     return shift_day_dict
 
 
 
-def process_overtime_and_guesthouse(punch_dict, punch_place_dict, index_map, holiday_set, person_dept_dict):
+# 倒班记录用到的列（缺少上/下班时间的记录按不完整跳过）
+SHIFT_SCHEMA = InputSchema(["工号"], optional=["上班时间", "下班时间"], str_columns=["工号"])
+
+# 原始打卡记录汇总用到的列（考勤点名称用于排除门禁读卡器）
+RECORD_SCHEMA = InputSchema(["工号", "考勤时间"], optional=["考勤点名称"], str_columns=["工号"])
+
+# 原始打卡记录分块读取的行数
+PUNCH_CHUNK_SIZE = 500000
+
+_DAILY_AGGREGATIONS = {"first": "min", "last": "max", "first_kept": "min", "last_kept": "max"}
+
+
+def read_punch_chunks(source, chunksize=PUNCH_CHUNK_SIZE):
+    """
+    分块读取原始打卡记录（PC打卡记录），只读取 RECORD_SCHEMA 声明的列
+    :param source: CSV/Excel 文件路径、上传文件对象或已读入的 DataFrame
     """
-    针对所有有打卡记录的员工，计算加班时长、招待所员工出勤时长
+    if isinstance(source, pd.DataFrame):
+        yield source
+        return
+    if str(getattr(source, "name", source)).endswith(".csv"):
+        for chunk in RECORD_SCHEMA.read_csv_chunks(source, chunksize):
+            yield chunk
+    else:
+        # Excel 无法分块解析，整表读取后作为一个分块
+        yield RECORD_SCHEMA.read_excel(source)
+
+
+def aggregate_punch_records(source, employees, shift_codes=(), chunksize=PUNCH_CHUNK_SIZE, rules=None):
     """
-    for key, punch_times in punch_dict.items():
-        emp_id, date = key
-        punch_times = sorted(punch_times)
-
-        if not punch_times:
-            continue
-
-        earliest = punch_times[0]
-        latest = punch_times[-1]
-        org_name = person_dept_dict.get(emp_id, "")
-
-        if key not in index_map:
-            index_map[key] = {}
-
-        if "招待所" in org_name:
-            duration = latest - earliest
-            # if emp_id == "02019003":
-            #     print(emp_id, date, duration)
-            if duration >= timedelta(hours=8):
-                index_map[key]["pc出勤状态"] = "正常出勤"
-            elif duration >= timedelta(hours=7):
-                index_map[key]["pc出勤状态"] = "缺勤"
-                if date not in holiday_set:
-                    index_map[key]["是否异常"] = "是"
-            else:
-                index_map[key]["pc出勤状态"] = "出勤时间少于7小时"
-                if date not in holiday_set:
-                    index_map[key]["是否异常"] = "是"
+    流式汇总原始打卡记录：每块先归约为 (工号编码, 日期) 的最早/最晚打卡，再逐块合并，
+    峰值内存取决于汇总结果而不是打卡记录条数；不在通信录中的工号读入后即丢弃
+    :param employees: 通信录 EmployeeIndex
+    :param shift_codes: 倒班员工的通信录编码，只为这些员工保留逐条打卡时间供倒班窗口匹配
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
+    :return: (daily, PunchIndex)
+        daily 以 (编码, 日期) 为索引，列 first/last 为当天最早/最晚打卡，
+        first_kept/last_kept 为排除规则中门禁读卡器（excluded_places）后的最早/最晚打卡；PunchIndex 以编码为员工键
+    """
+    excluded_places = (rules or get_rules()).excluded_places
+    shift_codes = np.unique(np.asarray(list(shift_codes), dtype=np.int64))
+    total_rows = len(source) if isinstance(source, pd.DataFrame) else estimate_csv_rows(source)
+    rows_read = 0
+    partials = []
+    shift_emps = []
+    shift_times = []
+    daily = None
+
+    for chunk in read_punch_chunks(source, chunksize):
+        chunk.columns = chunk.columns.str.strip()
+        codes = employees.codes(chunk["工号"], "record")
+        punch_time = parse_datetimes(chunk["考勤时间"])
+        if "考勤点名称" in chunk.columns:
+            kept_time = punch_time.where(~chunk["考勤点名称"].astype(str).str.strip().isin(excluded_places))
         else:
-            if date in holiday_set:
-                punches_today = punch_dict.get((emp_id, date), [])
-                if punches_today:
-                    punches_with_places = list(zip(punch_times, punch_place_dict[key]))
-                    sorted_punches = sorted([t for t, p in punches_with_places if p not in ["河口1号门入口右2_门_1_读卡器_1_考勤点", "河口-九号门出口_门_1_读卡器_1_考勤点"]])
-
-                    # 确保sorted_punches不为空
-                    if sorted_punches:
-                        # 获取最早和最晚打卡时间
-                        earliest_punch = sorted_punches[0]
-                        latest_punch = sorted_punches[-1]
-                        # 计算时间间隔（单位：小时）
-                        index_map[key]["加班时长"] = math.ceil((latest_punch - earliest_punch).total_seconds() / 3600)
-            else :
-                standard_end = datetime.combine(latest.date(), datetime.strptime("18:30", "%H:%M").time())
-                overtime = latest - standard_end
-                if overtime.total_seconds() > 0:
-                    index_map[key]["加班时长"] = math.ceil(overtime.total_seconds() / 3600)
-
-
-def fill_shift_attendance(index_map, shift_df, record_df, holiday_set, person_dept_dict):
+            kept_time = punch_time
+
+        valid = punch_time.notna().to_numpy()
+        record(rows_in=len(chunk), unmatched=(valid & (codes < 0)).sum())
+        count("invalid_punch_time", (~valid).sum())
+        valid = valid & (codes >= 0)
+        frame = pd.DataFrame({
+            "编码": codes,
+            "日期": punch_time.dt.normalize(),
+            "first": punch_time,
+            "last": punch_time,
+            "first_kept": kept_time,
+            "last_kept": kept_time,
+        })[valid]
+        partials.append(frame.groupby(["编码", "日期"], sort=False).agg(_DAILY_AGGREGATIONS))
+
+        if len(shift_codes):
+            is_shift = valid & np.isin(codes, shift_codes)
+            shift_emps.append(codes[is_shift])
+            shift_times.append(punch_time[is_shift].to_numpy())
+
+        # 定期合并各块的部分汇总，避免部分结果累积
+        if len(partials) >= 8:
+            partials = [_merge_daily(partials)]
+
+        # 每块结束时上报进度（估计的总行数偏小时以已读行数为准），取消在此生效
+        rows_read += len(chunk)
+        advance(rows_read, max(total_rows, rows_read) if total_rows is not None else None)
+
+    if partials:
+        daily = _merge_daily(partials)
+    else:
+        daily = pd.DataFrame(columns=list(_DAILY_AGGREGATIONS), index=pd.MultiIndex.from_arrays([[], []], names=["编码", "日期"]))
+
+    record(rows_out=len(daily))
+    punch_index = PunchIndex(
+        np.concatenate(shift_emps) if shift_emps else np.array([], dtype=np.int64),
+        np.concatenate(shift_times) if shift_times else np.array([], dtype="datetime64[ns]"),
+    )
+    return daily, punch_index
+
+
+def _merge_daily(partials):
+    if len(partials) == 1:
+        return partials[0]
+    return pd.concat(partials).groupby(level=["编码", "日期"], sort=False).agg(_DAILY_AGGREGATIONS)
+
+
+def process_overtime_and_guesthouse(daily, grid, holiday_set, rules=None):
     """
-    主函数：处理倒班出勤、加班时长与招待所正常出勤
+    针对所有有打卡记录的员工，计算加班时长、招待所员工出勤时长（按列整体计算）
+    :param daily: aggregate_punch_records 得到的 (编码, 日期) 打卡汇总
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
     """
+    if daily.empty:
+        return
+    codes = daily.index.get_level_values("编码").to_numpy(dtype=np.int64)
+    days = daily.index.get_level_values("日期")
+    positions = grid.positions_for_codes(codes)
+    offsets = grid.day_offsets(days)
+    rows = grid.rows_for(positions, offsets)
+    count("punch_days", len(rows))
+    record(unmatched=grid.unmatched_count(codes, offsets))
+
+    # 招待所等单位按部门名称识别，规则按员工解析一次后展开到每条汇总
+    rules = (rules or get_rules()).for_employees(grid)
+    is_guesthouse = rules["guesthouse"][positions]
+    is_holiday = days.isin(pd.to_datetime(list(holiday_set)))
+    earliest = daily["first"].to_numpy()
+    latest = daily["last"].to_numpy()
+
+    # 招待所：出勤满 8 小时为正常，7~8 小时为缺勤，不足 7 小时单独标注；非节假日的后两者标记异常
+    hours = (latest - earliest) / np.timedelta64(1, "h")
+    min_hours = rules["guesthouse_min_hours"][positions]
+    full_day = hours >= rules["guesthouse_full_hours"][positions]
+    short_day = hours >= min_hours
+    guest_status = np.where(full_day, "正常出勤", np.where(short_day, "缺勤", _short_day_labels(min_hours))).astype(object)
+    grid.set("pc出勤状态", rows[is_guesthouse], guest_status[is_guesthouse])
+    grid.set("是否异常", rows[is_guesthouse & ~full_day & ~is_holiday], True)
+
+    # 其他员工节假日：排除门禁读卡器后的最早、最晚打卡间隔，向上取整为小时
+    holiday_span = _ceil_hours(daily["last_kept"].to_numpy() - daily["first_kept"].to_numpy())
+    holiday_overtime = ~is_guesthouse & is_holiday & daily["first_kept"].notna().to_numpy()
+    grid.set("加班时长", rows[holiday_overtime], holiday_span[holiday_overtime])
+
+    # 其他员工工作日：最晚打卡超过加班起算时刻（默认 18:30）的部分，向上取整为小时
+    overtime = latest - (days.to_numpy() + rules["overtime_start"][positions].astype("timedelta64[m]"))
+    workday_overtime = ~is_guesthouse & ~is_holiday & (overtime > np.timedelta64(0, "s"))
+    grid.set("加班时长", rows[workday_overtime], _ceil_hours(overtime)[workday_overtime])
+
+
+def _short_day_labels(min_hours):
+    """招待所出勤不足 min_hours 小时的状态文字（每个不同的小时数只生成一次）"""
+    values, inverse = np.unique(min_hours, return_inverse=True)
+    labels = np.array([f"出勤时间少于{value:g}小时" for value in values], dtype=object)
+    return labels[inverse]
+
+
+def _ceil_hours(durations):
+    """时间间隔数组 -> 向上取整的小时数（空值为 0）"""
+    seconds = durations / np.timedelta64(1, "s")
+    return np.nan_to_num(np.ceil(seconds / 3600)).astype(np.int64)
+
+
+def shift_employee_codes(shift_df, employees):
+    """倒班记录中出现的员工（通信录编码，去重）"""
     shift_df.columns = shift_df.columns.str.strip()
-    record_df.columns = record_df.columns.str.strip()
-
-    # Step 1: 构建打卡字典和组织名称字典
-    punch_dict = defaultdict(list)
-    punch_place_dict = defaultdict(list)
-    # org_dict = {}
-    print("开始构建打卡字典")
-    for _, row in record_df.iterrows():
-        emp_id = re.sub(r'\s+', '', str(row["工号"]))  # 使用正则表达式去除所有空白字符
-        punch_time = pd.to_datetime(row["考勤时间"], errors="coerce")
-        # org_name = str(row.get("所属组织", "")).strip()
-        # 获取打卡地点列
-        punch_place = str(row.get("考勤点名称", "")).strip()
-
-        if pd.notna(punch_time):
-            key = (emp_id, punch_time.date())
-            punch_dict[key].append(punch_time)
-            punch_place_dict[key].append(punch_place)
-
-
-            # if key not in org_dict:
-            #     org_dict[key] = org_name
-    print("打卡字典构建完成")
+    codes = employees.codes(shift_df["工号"], "shift")
+    return np.unique(codes[codes >= 0])
+
+
+def fill_shift_attendance(grid, shift_df, record_source, holiday_set, punches=None, rules=None):
+    """
+    主函数：处理倒班出勤、加班时长与招待所正常出勤
+    :param record_source: 原始打卡记录（文件路径、上传文件对象或 DataFrame），分块流式读取
+    :param punches: 已汇总的 (daily, PunchIndex)；给出时不再读取 record_source
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
+    """
+    shift_codes = shift_employee_codes(shift_df, grid.employees)
+
+    # Step 1: 流式汇总打卡记录
+    if punches is None:
+        print("开始汇总打卡记录")
+        punches = aggregate_punch_records(record_source, grid.employees, shift_codes, rules=rules)
+        print("打卡记录汇总完成")
+    daily, punch_index = punches
 
     # Step 2: 处理倒班员工的出勤判断
-    shift_day_dict = process_shift_attendance(shift_df, punch_dict, index_map)
+    shift_day_dict = process_shift_attendance(shift_df, punch_index, grid, rules)
     print("倒班员工出勤已经完成")
 
     # Step 3: 针对所有员工统计加班/出勤
-    process_overtime_and_guesthouse(punch_dict, punch_place_dict, index_map, holiday_set, person_dept_dict)
+    process_overtime_and_guesthouse(daily, grid, holiday_set, rules)
     print("加班已经完成")
 
     return shift_day_dict
@@ -1,33 +1,49 @@
+import numpy as np
 import pandas as pd
-import re
 
-def fill_oa_attendance(index_map, oa_df):
+from attendance_rules import get_rules
+from input_schema import InputSchema
+from instrumentation import record
+
+# OA打卡用到的列
+OA_SCHEMA = InputSchema(["编号", "打卡时间"], str_columns=["编号"])
+
+def fill_oa_attendance(grid, oa_df, rules=None):
     """
     根据 OA 打卡数据填充 oa出勤状态 和 是否打卡
-    :param index_map: (工号, 日期) -> record 的索引
+    :param grid: AttendanceGrid 列式考勤表
     :param oa_df: 原始OA打卡记录（DataFrame）
+    :param rules: 考勤规则 RuleSet，默认为当前生效的规则
     """
+    rules = (rules or get_rules()).for_employees(grid)
+
     # 转换时间字段
     oa_df["打卡时间"] = pd.to_datetime(oa_df["打卡时间"])
+    punch_time = oa_df["打卡时间"]
+
+    # 工号统一换算为通信录整数编码，不在通信录中的为 -1
+    codes = grid.employees.codes(oa_df["编号"], "oa")
+    positions = grid.positions_for_codes(codes)
+
+    # 逐条打卡计算当天分钟数，按员工所在单位的上/下班时刻判断是否满足早/晚打卡条件
+    minute_of_day = (punch_time.dt.hour * 60 + punch_time.dt.minute).to_numpy()
+    punches = pd.DataFrame({
+        "编码": codes,
+        "打卡日期": punch_time.dt.normalize().to_numpy(),
+        "has_morning": minute_of_day < rules["oa_on_duty"][positions],
+        "has_evening": minute_of_day > rules["oa_off_duty"][positions],
+    })
+
+    # 分组处理：按工号编码 + 打卡日期聚合（无效打卡时间的记录不参与分组）
+    daily = punches.groupby(["编码", "打卡日期"], sort=False)[["has_morning", "has_evening"]].any()
+    if daily.empty:
+        record(rows_in=len(oa_df))
+        return
 
-    # 添加新列：日期、小时
-    oa_df["打卡日期"] = oa_df["打卡时间"].dt.date
-    oa_df["打卡小时"] = oa_df["打卡时间"].dt.hour
-    oa_df["打卡分钟"] = oa_df["打卡时间"].dt.minute
-
-    # 分组处理：按工号 + 打卡日期聚合 工号转换为字符串
-    # 使用正则表达式去除所有空白字符（空格、制表符、换行符等）
-    oa_df["编号"] = oa_df["编号"].astype(str).str.replace(r'\s+', '', regex=True)
-    grouped = oa_df.groupby(["编号", "打卡日期"])
-
-    for (emp_id, date), group in grouped:
-        has_morning = any(t < 9 for t in group["打卡小时"])
-        has_evening = any(t > 18 or (t == 18 and m > 0) for t, m in zip(group["打卡小时"], group["打卡分钟"]))
-
-        key = (emp_id, date)
-        if key in index_map:
-            record = index_map[key]
-            record["oa出勤状态"] = "正常出勤" if has_morning and has_evening else "异常"
-            record["oa是否打卡"] = True 
-        # else:
-            # print(f"❗OA考勤表: {grouped},未找到 key: {key}，请确认 index_map 中是否存在")
\ No newline at end of file
+    daily_codes = daily.index.get_level_values("编码")
+    offsets = grid.day_offsets(daily.index.get_level_values("打卡日期"))
+    rows = grid.rows_for(grid.positions_for_codes(daily_codes), offsets)
+    record(rows_in=len(oa_df), rows_out=(rows >= 0).sum(), unmatched=grid.unmatched_count(daily_codes, offsets))
+    normal = daily["has_morning"].to_numpy() & daily["has_evening"].to_numpy()
+    grid.set("oa出勤状态", rows, np.where(normal, "正常出勤", "异常").astype(object))
+    grid.set("oa是否打卡", rows, True)
@@ -0,0 +1,106 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from exporter import dept_file_name
+from input_schema import estimate_csv_rows
+from instrumentation import advance, count, record
+
+# 拆分时每次读取的行数
+SPLIT_CHUNK_SIZE = 200000
+
+# 同时保持打开的输出文件数上限（超过时关闭最久未写入的文件，再次写入时以追加方式重新打开）
+MAX_OPEN_WRITERS = 64
+
+OUTPUT_ENCODING = "utf-8-sig"
+
+
+def secondary_organizations(org_series):
+    """所属组织列 -> 二级组织列（每个不同的组织字符串只拆分一次，无二级组织时为空值）"""
+    codes, uniques = pd.factorize(org_series)
+    second_levels = np.append(pd.Index(uniques).str.split("/").str[1].to_numpy(dtype=object), None)
+    return pd.Series(second_levels[codes], index=org_series.index)
+
+
+def split_output_name(org_name):
+    """二级组织名 -> 拆分后的文件名"""
+    return f"{dept_file_name(org_name)}_考勤记录.csv"
+
+
+class _WriterPool:
+    """
+    按文件名复用已打开的输出文件；打开的文件数不超过 max_open，
+    被关闭的文件再次写入时追加内容，表头只在文件首次写入时输出
+    """
+
+    def __init__(self, output_dir, max_open=MAX_OPEN_WRITERS):
+        self.output_dir = output_dir
+        self.max_open = max(int(max_open), 1)
+        self._open = OrderedDict()
+        self.paths = {}
+
+    def write(self, file_name, frame):
+        handle = self._open.pop(file_name, None)
+        if handle is None:
+            if len(self._open) >= self.max_open:
+                _, oldest = self._open.popitem(last=False)
+                oldest.close()
+            path = self.paths.get(file_name)
+            if path is None:
+                path = self.paths[file_name] = os.path.join(self.output_dir, file_name)
+                handle = open(path, "w", encoding=OUTPUT_ENCODING, newline="")
+                frame.to_csv(handle, index=False)
+            else:
+                handle = open(path, "a", encoding=OUTPUT_ENCODING, newline="")
+                frame.to_csv(handle, index=False, header=False)
+        else:
+            frame.to_csv(handle, index=False, header=False)
+        self._open[file_name] = handle
+
+    def close(self):
+        while self._open:
+            _, handle = self._open.popitem()
+            handle.close()
+
+
+def _read_chunks(source, chunksize):
+    """分块读取原始打卡记录（全部列按字符串读取，原样写出）"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if str(getattr(source, "name", source)).endswith(".csv"):
+        for chunk in pd.read_csv(source, encoding="gbk", dtype=str, keep_default_na=False, chunksize=chunksize):
+            yield chunk
+    else:
+        # Excel 无法分块解析，整表读取后作为一个分块
+        yield pd.read_excel(source, dtype=str).fillna("")
+
+
+def split_punch_records(source, output_dir, chunksize=SPLIT_CHUNK_SIZE, max_open=MAX_OPEN_WRITERS):
+    """
+    按二级组织（所属组织按 / 拆分后的第二段）拆分原始打卡记录
+    CSV 分块流式读取，每块按二级组织分组后追加到对应文件，内存占用与文件大小无关
+    :param source: 原始打卡记录（CSV/Excel 文件路径或上传文件对象）
+    :param output_dir: 拆分后文件的存储目录
+    :param max_open: 同时打开的输出文件数上限
+    :return: 拆分后的文件路径列表（按文件名排序）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pool = _WriterPool(output_dir, max_open)
+    total_rows = estimate_csv_rows(source)
+    rows_read = 0
+    try:
+        for chunk in _read_chunks(source, chunksize):
+            chunk.columns = chunk.columns.str.strip()
+            orgs = secondary_organizations(chunk["所属组织"])
+            record(rows_in=len(chunk))
+            count("split_rows_without_org", orgs.isna().sum())
+            for org_name, group in chunk.groupby(orgs, sort=False):
+                pool.write(split_output_name(org_name), group)
+                record(rows_out=len(group))
+            rows_read += len(chunk)
+            advance(rows_read, max(total_rows, rows_read) if total_rows is not None else None)
+    finally:
+        pool.close()
+    return [pool.paths[name] for name in sorted(pool.paths)]
@@ -0,0 +1,189 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from employee_ids import normalize_ids
+from input_cache import fingerprint_inputs
+from processShift import aggregate_punch_records
+
+# 状态文件格式版本：保存内容变化时递增，旧状态自动作废（下次全量重算）
+STATE_VERSION = 4
+STATE_FILE = "run_state.pkl"
+
+# 各输入中的工号列（摘要按规范后的工号分组，与各 fill_* 的匹配方式一致）
+EMPLOYEE_COLUMNS = {
+    "pc": "工号",
+    "oa": "编号",
+    "leave": "人员编码",
+    "qj": "工号",
+    "trip": "人员编号",
+    "shift": "工号",
+}
+
+# 影响所有员工的输入：任一变化都需全量重算
+GLOBAL_KEYS = ["person", "holiday"]
+
+_POSITION_SALT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def global_key(files, date_range, rule_version):
+    """通信录、节假日、报表日期范围与规则版本共同决定的全局键"""
+    return f"{fingerprint_inputs({key: files[key] for key in GLOBAL_KEYS}, rule_version)}|{date_range}"
+
+
+def _sum_by_key(keys, values):
+    """按键对 uint64 数组求和（溢出回绕），返回 键 -> 和"""
+    codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+    if not len(uniques):
+        return {}
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    sums = np.add.reduceat(values[order], starts)
+    return dict(zip(uniques, sums))
+
+
+def _row_digests(frame, emp_ids):
+    """逐行摘要：行内容 + 该行在同一员工记录中的序号（记录顺序影响覆盖结果）"""
+    row_hash = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    position = emp_ids.groupby(emp_ids, sort=False).cumcount().to_numpy().astype(np.uint64)
+    return pd.util.hash_array(row_hash ^ (position * _POSITION_SALT))
+
+
+def employee_digests(frame, id_column):
+    """
+    逐员工摘要：某员工的任一记录内容或顺序变化时，其摘要随之变化
+    :return: 工号 -> uint64 摘要
+    """
+    if frame is None or id_column not in frame.columns or frame.empty:
+        return {}
+    emp_ids = pd.Series(normalize_ids(frame[id_column]), index=frame.index)
+    return _sum_by_key(emp_ids.to_numpy(dtype=object), _row_digests(frame, emp_ids))
+
+
+def punch_digests(punches, employees):
+    """打卡汇总（逐日最早/最晚打卡 + 倒班员工逐条打卡）的逐员工摘要，按通信录工号分组"""
+    daily, punch_index = punches
+    daily = daily.reset_index()
+    daily["工号"] = employees.ids[daily["编码"].to_numpy(dtype=np.int64)]
+    codes, millis = punch_index.punches()
+    punch_frame = pd.DataFrame({"工号": employees.ids[codes], "考勤时间": millis})
+
+    keys = []
+    values = []
+    for frame in (daily, punch_frame):
+        if frame.empty:
+            continue
+        emp_ids = frame["工号"].astype(str)
+        keys.append(emp_ids.to_numpy(dtype=object))
+        values.append(_row_digests(frame, emp_ids))
+    if not keys:
+        return {}
+    return _sum_by_key(np.concatenate(keys), np.concatenate(values))
+
+
+def _changed_keys(old, new):
+    return {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+
+
+class RunState:
+    """
+    增量重算的持久化运行状态（<state_dir>/run_state.pkl）
+    保存上次运行的全局键、各输入的逐员工摘要、打卡汇总以及完整的考勤表与汇总表；
+    下次运行时只重算输入有变化的员工，全局输入变化或无可用状态时全量重算
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, STATE_FILE)
+        self.data = self._load()
+        self._pending = {}
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != STATE_VERSION:
+            return None
+        return data
+
+    def punches(self, record_source, employees, shift_codes, rules, key):
+        """
+        汇总原始打卡记录：文件、规则与全局键均未变化且本次倒班员工均已包含在上次的逐条打卡中时，直接复用上次结果
+        （汇总结果按通信录的员工编码存储，通信录变化时全局键不同，不会复用）
+        :param rules: 考勤规则 RuleSet（排除的门禁读卡器影响汇总结果）
+        :param key: global_key 的返回值
+        :return: (daily, PunchIndex)
+        """
+        record_key = fingerprint_inputs({"record": record_source}, f"{STATE_VERSION}|{rules.fingerprint}|{key}")
+        shift_codes = set(int(code) for code in shift_codes)
+        data = self.data
+        if data is not None and data["record_key"] == record_key and shift_codes <= data["punch_emps"]:
+            punches = data["punches"]
+            shift_codes = data["punch_emps"]
+        else:
+            punches = aggregate_punch_records(record_source, employees, shift_codes, rules=rules)
+        self._pending.update(record_key=record_key, punch_emps=shift_codes, punches=punches)
+        return punches
+
+    def changed_employees(self, grid, key, inputs, punches):
+        """
+        对比各输入的逐员工摘要，找出需要重算的员工（须在各 fill_* 修改输入之前调用）
+        :param key: global_key 的返回值
+        :return: 员工序号数组（升序）；无可用状态或全局输入变化时返回 None，表示全量重算
+        """
+        digests = {
+            input_key: employee_digests(inputs[input_key][1] if input_key == "pc" else inputs[input_key], column)
+            for input_key, column in EMPLOYEE_COLUMNS.items()
+        }
+        digests["record"] = punch_digests(punches, grid.employees)
+        self._pending.update(global_key=key, digests=digests)
+
+        data = self.data
+        if data is None or data["global_key"] != key:
+            return None
+        changed = set()
+        for input_key, digest in digests.items():
+            changed |= _changed_keys(data["digests"].get(input_key, {}), digest)
+        positions = grid.emp_positions(list(changed))
+        return np.unique(positions[positions >= 0])
+
+    def merge(self, positions, grid, df_summary):
+        """
+        合并本次结果并保存状态
+        :param positions: changed_employees 的返回值；为 None 时 grid、df_summary 即完整结果
+        :param grid: 完整考勤表，或 positions 对应员工的子表（无员工需重算时可为 None）
+        :param df_summary: 与 grid 对应的汇总表
+        :return: 完整的 (AttendanceGrid, 汇总表)
+        """
+        if positions is not None:
+            full_grid = self.data["grid"]
+            summary = self.data["df_summary"]
+            if len(positions):
+                full_grid.assign(positions, grid)
+                keep = np.ones(len(summary), dtype=bool)
+                keep[positions] = False
+                summary = pd.concat([summary[keep], df_summary.set_axis(positions)]).sort_index()
+            grid, df_summary = full_grid, summary
+
+        self.data = dict(self._pending, version=STATE_VERSION, grid=grid, df_summary=df_summary)
+        self._pending = {}
+        self._save()
+        return grid, df_summary
+
+    def _save(self):
+        """先写临时文件再替换，避免中断后留下半个状态文件"""
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ 保存运行状态失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
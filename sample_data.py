@@ -0,0 +1,202 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 模拟部门（一级部门/二级部门），含按名称识别的 招待所 与 武汉分公司
+SAMPLE_DEPTS = [
+    "总部/财务部", "总部/人力资源部", "总部/信息中心",
+    "武汉分公司/生产部", "武汉分公司/销售部",
+    "河口厂/一车间", "河口厂/二车间", "河口厂/招待所",
+    "宜昌分公司/办公室", "宜昌分公司/运维部",
+]
+
+PC_STATUSES = ["正常出勤", "正常出勤", "正常出勤", "迟到", "早退", "缺勤", "旷工"]
+LEAVE_TYPES = ["病假", "事假", "年休假", "婚假", "丧假", "探亲假", "产假", "陪产假", "护理假", "育儿假", "其他假", None]
+TRIP_PLACES = ["北京", "上海", "广州", None]
+PUNCH_PLACES = ["河口1号门入口右2_门_1_读卡器_1_考勤点", "河口-九号门出口_门_1_读卡器_1_考勤点", "办公楼_考勤点", "车间_考勤点"]
+
+# Excel 单表最大行数（含表头）
+EXCEL_MAX_ROWS = 1048575
+
+
+def _to_excel(df, path):
+    if len(df) > EXCEL_MAX_ROWS:
+        print(f"⚠️ {os.path.basename(path)} 超过 Excel 行数上限，截取前 {EXCEL_MAX_ROWS} 行")
+        df = df.iloc[:EXCEL_MAX_ROWS]
+    df.to_excel(path, index=False)
+
+
+def _pick(rng, values, size):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), size)]
+
+
+def _day_minutes(rng, day_values, low, high):
+    """日期数组 + [low, high) 内随机分钟 -> datetime64 数组"""
+    minutes = rng.integers(low, high, len(day_values)).astype("timedelta64[m]")
+    return day_values.astype("datetime64[m]") + minutes
+
+
+def generate(out_dir, employees=1000, days=31, start="2025-05-01", punches_per_day=3,
+             oa_ratio=0.2, shift_ratio=0.1, seed=1):
+    """
+    生成九个输入文件的模拟数据（文件名含识别关键字，可直接用 pipeline.py -i 读取）
+    :param employees: 员工数
+    :param days: 报表天数
+    :param punches_per_day: 原始打卡记录中每人每天的平均打卡次数
+    :param oa_ratio: 使用 OA 打卡的员工比例
+    :param shift_ratio: 倒班员工比例
+    :return: 各文件的行数
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {}
+
+    emp_ids = np.array([f"{20000000 + i:08d}" for i in range(employees)], dtype=object)
+    names = np.array([f"员工{i}" for i in range(employees)], dtype=object)
+    depts = _pick(rng, SAMPLE_DEPTS, employees)
+    dates = np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + days)
+
+    # 通信录
+    person = pd.DataFrame({"姓名": names, "工号": emp_ids, "所在部门": depts})
+    _to_excel(person, os.path.join(out_dir, "通信录.xlsx"))
+    counts["通信录"] = len(person)
+
+    # 节假日：周六、周日
+    weekday = (dates.astype("datetime64[D]").view(np.int64) - 4) % 7  # 1970-01-01 为周四
+    holidays = pd.DataFrame({"日期": pd.to_datetime(dates[weekday >= 5])})
+    _to_excel(holidays, os.path.join(out_dir, "节假日.xlsx"))
+    counts["节假日"] = len(holidays)
+
+    # PC考勤结果：每人每天一行，少量工号带空格、缺少打卡时间
+    emp_pos = np.repeat(np.arange(employees), days)
+    day_values = np.tile(dates, employees)
+    n_rows = len(emp_pos)
+    raw_ids = emp_ids[emp_pos].copy()
+    padded = rng.random(n_rows) < 0.05
+    raw_ids[padded] = " " + raw_ids[padded]
+    missing = rng.random(n_rows)
+    on_time = pd.Series(rng.integers(50, 60, n_rows)).map("08:{:02d}".format).to_numpy(dtype=object)
+    off_time = pd.Series(rng.integers(0, 10, n_rows)).map("18:{:02d}".format).to_numpy(dtype=object)
+    on_time[missing < 0.2] = ""
+    off_time[missing < 0.15] = ""
+    pc = pd.DataFrame({
+        "姓名": names[emp_pos],
+        "工号": raw_ids,
+        "出勤状态": _pick(rng, PC_STATUSES, n_rows),
+        "所属组织": depts[emp_pos],
+        "考勤日期": pd.to_datetime(day_values).strftime("%Y/%m/%d"),
+        "上班考勤时间": on_time,
+        "下班考勤时间": off_time,
+    })
+    pc.to_csv(os.path.join(out_dir, "PC考勤结果.csv"), index=False, encoding="gbk")
+    counts["PC考勤结果"] = len(pc)
+
+    # OA打卡：部分员工约一半的日子打卡 1~3 次
+    oa_emps = np.arange(int(employees * oa_ratio))
+    oa_pos = np.repeat(oa_emps, days)
+    oa_days = np.tile(dates, len(oa_emps))
+    keep = rng.random(len(oa_pos)) < 0.5
+    repeats = rng.integers(1, 4, keep.sum())
+    oa_pos = np.repeat(oa_pos[keep], repeats)
+    oa_days = np.repeat(oa_days[keep], repeats)
+    oa = pd.DataFrame({"编号": emp_ids[oa_pos], "打卡时间": _day_minutes(rng, oa_days, 7 * 60, 20 * 60)})
+    _to_excel(oa, os.path.join(out_dir, "OA打卡.xlsx"))
+    counts["OA打卡"] = len(oa)
+
+    def interval_starts(size, back):
+        return dates[rng.integers(0, days, size)] - rng.integers(0, back + 1, size).astype("timedelta64[D]")
+
+    # 离岗登记：约 20% 无返岗日期
+    n_leave = max(employees // 5, 1)
+    leave_start = interval_starts(n_leave, 3)
+    leave_end = pd.Series(leave_start + rng.integers(0, 5, n_leave).astype("timedelta64[D]"))
+    leave_end[rng.random(n_leave) < 0.2] = pd.NaT
+    leave = pd.DataFrame({"人员编码": _pick(rng, emp_ids, n_leave), "离岗日期": leave_start, "返岗日期": leave_end})
+    _to_excel(leave, os.path.join(out_dir, "离岗登记.xlsx"))
+    counts["离岗登记"] = len(leave)
+
+    # 请假记录
+    n_qj = max(employees // 3, 1)
+    qj_start = interval_starts(n_qj, 5)
+    qj = pd.DataFrame({
+        "工号": _pick(rng, emp_ids, n_qj),
+        "请假开始日期": qj_start,
+        "请假结束日期": qj_start + rng.integers(0, 7, n_qj).astype("timedelta64[D]"),
+        "请假类型新": _pick(rng, LEAVE_TYPES, n_qj),
+        "请假天数": _pick(rng, [0.5, 1, 2, 3], n_qj),
+    })
+    _to_excel(qj, os.path.join(out_dir, "请假记录.xlsx"))
+    counts["请假记录"] = len(qj)
+
+    # 出差记录：少量缺少开始日期、结束早于开始
+    n_trip = max(employees // 5, 1)
+    trip_start = pd.Series(interval_starts(n_trip, 5))
+    trip_end = trip_start + pd.to_timedelta(rng.integers(-1, 6, n_trip), unit="D")
+    trip_start[rng.random(n_trip) < 0.05] = pd.NaT
+    trip = pd.DataFrame({
+        "人员编号": _pick(rng, emp_ids, n_trip),
+        "出差开始日期": trip_start,
+        "出差结束日期": trip_end,
+        "出差地点": _pick(rng, TRIP_PLACES, n_trip),
+    })
+    _to_excel(trip, os.path.join(out_dir, "出差记录.xlsx"))
+    counts["出差记录"] = len(trip)
+
+    # 倒班记录：倒班员工隔天上班，班长 12/24 小时
+    shift_emps = np.arange(employees // 2, employees // 2 + int(employees * shift_ratio))
+    shift_days = dates[::2]
+    shift_pos = np.repeat(shift_emps, len(shift_days))
+    shift_start = (np.tile(shift_days, len(shift_emps)).astype("datetime64[h]")
+                   + _pick(rng, [8, 20], len(shift_pos)).astype(np.int64).astype("timedelta64[h]"))
+    shift_end = shift_start + _pick(rng, [12, 24], len(shift_pos)).astype(np.int64).astype("timedelta64[h]")
+    shift = pd.DataFrame({
+        "工号": emp_ids[shift_pos],
+        "姓名": names[shift_pos],
+        "上班时间": pd.to_datetime(shift_start).strftime("%Y-%m-%d %H:%M"),
+        "下班时间": pd.to_datetime(shift_end).strftime("%Y-%m-%d %H:%M"),
+    })
+    shift.to_csv(os.path.join(out_dir, "倒班记录.csv"), index=False, encoding="gbk")
+    counts["倒班记录"] = len(shift)
+
+    # PC打卡记录：约 60% 的人天有打卡，次数均值为 punches_per_day
+    rec_pos = np.repeat(np.arange(employees), days)
+    rec_days = np.tile(dates, employees)
+    keep = rng.random(len(rec_pos)) < 0.6
+    repeats = rng.integers(1, 2 * punches_per_day, keep.sum())
+    rec_pos = np.repeat(rec_pos[keep], repeats)
+    rec_days = np.repeat(rec_days[keep], repeats)
+    record = pd.DataFrame({
+        "工号": emp_ids[rec_pos],
+        "姓名": names[rec_pos],
+        "所属组织": "集团/" + pd.Series(depts[rec_pos]),
+        "考勤时间": _day_minutes(rng, rec_days, 0, 24 * 60) + rng.integers(0, 60, len(rec_pos)).astype("timedelta64[s]"),
+        "考勤点名称": _pick(rng, PUNCH_PLACES, len(rec_pos)),
+    })
+    record = record.sort_values(["工号", "考勤时间"], kind="stable")
+    record.to_csv(os.path.join(out_dir, "PC打卡记录.csv"), index=False, encoding="gbk")
+    counts["PC打卡记录"] = len(record)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成考勤分析模拟数据（九个输入文件）")
+    parser.add_argument("out_dir", help="输出目录")
+    parser.add_argument("-n", "--employees", type=int, default=1000, help="员工数，默认 1000")
+    parser.add_argument("-d", "--days", type=int, default=31, help="报表天数，默认 31")
+    parser.add_argument("--start", default="2025-05-01", help="起始日期，默认 2025-05-01")
+    parser.add_argument("--punches-per-day", type=int, default=3, help="每人每天平均打卡次数，默认 3")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args(argv)
+
+    counts = generate(args.out_dir, args.employees, args.days, args.start, args.punches_per_day, seed=args.seed)
+    for name, count in counts.items():
+        print(f"{name}: {count} 行")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import contextvars
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import advance, count, record, stage
+
+
+class Stage:
+    """
+    一个处理阶段：以 func(列块, *输入) 调用，只写 outputs 声明的明细字段
+    :param inputs: 输入名列表，取自 run_stages 的 data；输入名为其他阶段名时取该阶段的返回值，并在其合并后执行
+    :param outputs: 写入的明细字段
+    :param message: 阶段开始时的进度提示
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), message=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.message = message
+
+
+def _run_stage(item, block, args):
+    """在工作线程中执行一个阶段，返回 (返回值, 阶段记录)"""
+    timings = []
+    with stage(timings, item.name):
+        result = item.func(block, *args)
+    return result, timings[0]
+
+
+def _roll_up(entry):
+    """把子阶段的行数、计数上报到外层阶段，使合计中的未匹配记录等不因并行而遗漏"""
+    record(entry.get("rows_in"), entry.get("rows_out"), entry.get("unmatched"))
+    for name, n in entry.get("counters", {}).items():
+        count(name, n)
+
+
+def run_stages(grid, stages, data, timings, name="fill_stages", progress=None, workers=None):
+    """
+    按依赖关系并发执行各阶段：每个阶段写入自己的列块（grid.block），互不干扰；
+    各列块再按 stages 的声明顺序合并回 grid，同一字段以后声明的阶段为准（与依次执行的结果一致）
+    阶段在线程中执行（numpy/pandas 的大部分计算会释放 GIL），墙钟时间接近最慢的单个阶段
+    :param data: 输入名 -> 数据
+    :param timings: 阶段记录列表；追加外层阶段 name（墙钟耗时）及各子阶段 "<name>:<阶段名>"
+    :param workers: 并发线程数，默认按 CPU 核数；为 1 时依次执行
+    :return: 阶段名 -> 返回值
+    """
+    names = [item.name for item in stages]
+    for i, item in enumerate(stages):
+        later = [key for key in item.inputs if key in names[i:]]
+        if later:
+            raise ValueError(f"阶段 {item.name} 依赖的阶段须在其之前声明：{', '.join(later)}")
+        missing = [key for key in item.inputs if key not in names and key not in data]
+        if missing:
+            raise ValueError(f"阶段 {item.name} 缺少输入：{', '.join(missing)}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(stages)))
+
+    results = {}
+    entries = {}
+    blocks = {}
+    with stage(timings, name):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = list(stages)
+            running = {}
+            merged = 0
+
+            while merged < len(stages):
+                # 提交依赖均已合并的阶段（依次执行时每次只提交一个）
+                for item in list(pending):
+                    if len(running) >= workers:
+                        break
+                    if any(key in names and key not in results for key in item.inputs):
+                        continue
+                    if progress is not None and item.message:
+                        progress(item.message)
+                    pending.remove(item)
+                    blocks[item.name] = grid.block(item.outputs)
+                    args = [results[key] if key in names else data[key] for key in item.inputs]
+                    # 复制当前上下文，使工作线程中的 record/count 上报到各自的阶段
+                    context = contextvars.copy_context()
+                    future = executor.submit(context.run, _run_stage, item, blocks[item.name], args)
+                    running[future] = item
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    entries[item.name] = future.result()
+
+                # 按声明顺序合并已完成的列块
+                while merged < len(stages) and stages[merged].name in entries:
+                    item = stages[merged]
+                    grid.merge_block(blocks.pop(item.name))
+                    results[item.name], entry = entries[item.name]
+                    _roll_up(entry)
+                    merged += 1
+                    advance(merged, len(stages))
+
+    # 外层阶段在前，各子阶段按声明顺序随后（与 load_inputs / load:<key> 的排列一致）
+    for item in stages:
+        entry = entries[item.name][1]
+        entry["stage"] = f"{name}:{item.name}"
+        timings.append(entry)
+    return results
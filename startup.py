@@ -0,0 +1,161 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# 分析组件（按依赖顺序）：逐个导入时，每项耗时为该模块新增的导入开销
+STACK_MODULES = [
+    "numpy", "pandas", "openpyxl",
+    "instrumentation", "employee_ids", "attendance_grid", "attendance_rules", "input_schema", "input_cache",
+    "all", "processPCKQ", "processYDKQ", "processLGDJ", "processQJDJ", "processCCKQ", "processShift",
+    "loaders", "exporter", "run_state", "stage_scheduler", "pipeline",
+]
+
+# 窗口显示前不应导入的重量级模块（出现即视为启动回退）
+HEAVY_MODULES = ["numpy", "pandas", "openpyxl", "pipeline"]
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def measure_imports(modules=STACK_MODULES):
+    """
+    逐个导入并计时（须在新进程中调用才能反映冷启动开销，已导入的模块耗时为 0）
+    :return: [(模块名, 秒)]
+    """
+    costs = []
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        costs.append((name, round(time.perf_counter() - start, 4)))
+    return costs
+
+
+def format_import_report(costs):
+    """导入耗时报告（按耗时降序，附合计）"""
+    lines = [f"{'模块':<20}{'耗时(s)':>10}"]
+    for name, seconds in sorted(costs, key=lambda item: item[1], reverse=True):
+        lines.append(f"{name:<20}{seconds:>10.4f}")
+    lines.append(f"{'合计':<20}{sum(seconds for _, seconds in costs):>10.4f}")
+    return "\n".join(lines)
+
+
+class BackgroundImport:
+    """
+    在后台线程中导入分析组件：窗口显示后再开始，界面无需等待 pandas 等加载；
+    开始分析时 wait() 等待导入完成（导入出错时在此抛出）
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._done = threading.Event()
+        self.error = None
+        self.seconds = None
+
+    def start(self):
+        threading.Thread(target=self._run, name="background-import", daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._loader()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+
+
+def write_probe_output(path, text):
+    """
+    写出启动测量结果；--noconsole 打包的 exe 没有标准输出，结果一律写入调用方指定的文件
+    :param path: 输出文件路径，为 None 时打印到标准输出
+    """
+    if path is None:
+        print(text, flush=True)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _run_app(exe, *args):
+    """
+    以新进程运行界面：指定 exe 时运行打包后的可执行文件，否则以当前解释器运行 app.py（自身为 exe 时运行自身）
+    :return: 进程退出码与标准错误
+    """
+    if exe is not None:
+        command = [exe]
+    else:
+        command = [sys.executable] + ([] if getattr(sys, "frozen", False) else [APP_SCRIPT])
+    process = subprocess.Popen(command + list(args), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               text=True, encoding="utf-8", errors="replace")
+    _, stderr = process.communicate()
+    return process.returncode, (stderr or "").strip()
+
+
+def _probe(exe, *args):
+    """运行一次测量，结果由子进程写入临时文件，返回 (启动时刻, 文件内容)"""
+    fd, path = tempfile.mkstemp(prefix="attendance_probe_", suffix=".json")
+    os.close(fd)
+    try:
+        start = time.time()
+        returncode, stderr = _run_app(exe, *args, path)
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if returncode != 0 or not text:
+            raise RuntimeError(stderr or f"退出码 {returncode}")
+        return start, text
+    finally:
+        os.remove(path)
+
+
+def first_window_seconds(exe=None):
+    """
+    冷启动一次界面并计时：从启动进程到窗口完成首次绘制（子进程记录绘制完成的时刻）
+    :param exe: 打包后的可执行文件路径，默认运行 app.py
+    :return: (秒, 窗口显示前已导入的重量级模块列表)
+    :raises RuntimeError: 界面无法启动（如没有图形环境）
+    """
+    try:
+        start, text = _probe(exe, "--first-window-probe")
+    except RuntimeError as e:
+        raise RuntimeError(f"界面启动失败：{e}")
+    probe = json.loads(text)
+    return round(probe["shown_at"] - start, 4), probe["eager_modules"]
+
+
+def cold_import_costs(exe=None):
+    """在新进程中测量分析组件的逐模块导入耗时"""
+    try:
+        _, text = _probe(exe, "--import-time", "--json", "--output")
+    except RuntimeError as e:
+        raise RuntimeError(f"导入耗时测量失败：{e}")
+    return [tuple(item) for item in json.loads(text)]
+
+
+def run_startup_benchmark(repeat=5, imports=True, exe=None):
+    """
+    启动性能基准：首个窗口显示耗时取 repeat 次最小值，可另测逐模块导入耗时
+    :param exe: 打包后的可执行文件路径（测量 PyInstaller 产物），默认运行 app.py
+    :return: (阶段名 -> {"seconds": ...}, 窗口显示前已导入的重量级模块)
+    """
+    stages = {"first_window": {"seconds": float("inf")}}
+    eager = []
+    for _ in range(repeat):
+        seconds, eager = first_window_seconds(exe)
+        stages["first_window"]["seconds"] = min(stages["first_window"]["seconds"], seconds)
+    if imports:
+        for name, seconds in cold_import_costs(exe):
+            stages[f"import:{name}"] = {"seconds": seconds}
+    return stages, eager
@@ -1,20 +1,17 @@
+import io
+import json
 import os
+import shutil
+import tempfile
 import time
-import zipfile
 import streamlit as st
-import pandas as pd
-import tempfile
-from openpyxl.styles import PatternFill
-import shutil
 
 # 导入现有的处理函数
-from all import build_record_index, init_attendance_template, summarize_attendance
-from processCCKQ import fill_business_trip
-from processLGDJ import fill_leave_registration
-from processPCKQ import fill_pc_attendance, process_pc_attendance
-from processQJDJ import fill_leave_info
-from processShift import fill_shift_attendance
-from processYDKQ import fill_oa_attendance
+from input_cache import InputCache, ResultCache, fingerprint_inputs
+from instrumentation import format_timings, summary_text
+from exporter import clean_zeros, department_workbooks, write_results_zip
+from pipeline import FILE_TYPE_MAPPING, REQUIRED_KEYS, RULE_VERSION, match_input_files, run_pipeline
+from punch_splitter import split_punch_records
 
 # 设置页面配置
 st.set_page_config(
@@ -27,141 +24,95 @@ st.set_page_config(
 # 页面标题
 st.title("📊 考勤分析工具")
 
-# 文件类型映射：关键字 -> 文件描述
-FILE_TYPE_MAPPING = {
-    "通信录": "person",
-    "OA打卡": "oa",
-    "出差记录": "trip",
-    "PC考勤结果": "pc",
-    "离岗登记": "leave",
-    "倒班记录": "shift",
-    "请假记录": "qj",
-    "节假日": "holiday",
-    "PC打卡记录": "record"
-}
-
-# === 在保存汇总表之前，清理 0 ===
-@st.cache_data
-def clean_zeros(df):
-    return df.applymap(lambda x: "" if (isinstance(x, (int, float)) and x == 0) else x)
-
-# === 保存带颜色标记的Excel文件 ===
-def save_excel_with_highlight(df, file_path):
-    # 创建ExcelWriter对象
-    writer = pd.ExcelWriter(file_path, engine='openpyxl')
-    # 将DataFrame写入Excel
-    df.to_excel(writer, index=False, sheet_name='Sheet1')
-    # 获取工作表对象
-    worksheet = writer.sheets['Sheet1']
-    
-    # 查找'是否异常'列的索引
-    abnormal_col = None
-    for col_idx, col_name in enumerate(df.columns):
-        if col_name == '是否异常':
-            abnormal_col = col_idx + 1  # openpyxl列索引从1开始
-            break
-    
-    # 如果找到'是否异常'列，添加颜色标记
-    if abnormal_col is not None:
-        # 创建填充样式（黄色背景）
-        fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-        
-        # 遍历所有行，标记'是否异常'为'是'的行
-        for row_idx in range(2, len(df) + 2):  # 从第二行开始（第一行是表头）
-            cell = worksheet.cell(row=row_idx, column=abnormal_col)
-            if cell.value == '是':
-                # 标记整行
-                for col in range(1, len(df.columns) + 1):
-                    worksheet.cell(row=row_idx, column=col).fill = fill
-    
-    # 保存文件
-    writer.close()
-
 # === 拆分原始打卡记录 ===
-# def split_attendance_records(input_file, output_dir):
-#     """
-#     按二级组织拆分考勤记录文件
-#     :param input_file: 输入的考勤记录文件（CSV或Excel）
-#     :param output_dir: 拆分后文件的存储目录
-#     :return: 拆分后的文件列表
-#     """
-#     # 读取文件
-#     if input_file.name.endswith('.csv'):
-#         df = pd.read_csv(input_file, encoding='gbk')
-#     else:
-#         df = pd.read_excel(input_file)
-#     
-#     # 确保输出目录存在
-#     if not os.path.exists(output_dir):
-#         os.makedirs(output_dir)
-#     
-#     # 从所属组织列中提取二级组织
-#     df['二级组织'] = df['所属组织'].str.split('/').str[1]
-#     
-#     # 按二级组织分组并保存文件
-#     split_files = []
-#     grouped = df.groupby('二级组织')
-#     
-#     for org_name, group in grouped:
-#         # 移除临时添加的二级组织列
-#         group = group.drop(columns=['二级组织'])
-#         output_file_path = os.path.join(output_dir, f'{org_name}_考勤记录.csv')
-#         group.to_csv(output_file_path, index=False, encoding='utf-8-sig')
-#         split_files.append(output_file_path)
-#     
-#     return split_files
-
 def split_attendance_records(input_file, output_dir):
     """
-    拆分原始打卡记录功能已停用
-    :return: 空列表
+    按二级组织拆分原始打卡记录（流式拆分到临时目录，不读入内存）
+    :param input_file: 上传的原始打卡记录文件
+    :param output_dir: 拆分文件的临时目录，写入 ZIP 后由调用方删除
+    :return: 拆分后的文件路径列表
     """
-    return []
+    return split_punch_records(input_file, output_dir)
 
 # === 创建ZIP文件 ===
-def create_zip_file(zip_filename, summary_file, detail_file, dept_summary_files, dept_detail_files, split_files=[]):
-    with zipfile.ZipFile(zip_filename, 'w') as zipf:
-        # 添加整体汇总表和明细表
-        if os.path.exists(summary_file):
-            zipf.write(summary_file, os.path.basename(summary_file))
-        if os.path.exists(detail_file):
-            zipf.write(detail_file, os.path.basename(detail_file))
-        
-        # 添加各单位汇总文件夹和文件
-        for dept_name, file_path in dept_summary_files:
-            if os.path.exists(file_path):
-                zipf.write(file_path, f"各单位汇总/{dept_name}_汇总.xlsx")
-        
-        # 添加各单位明细文件夹和文件
-        for dept_name, file_path in dept_detail_files:
-            if os.path.exists(file_path):
-                zipf.write(file_path, f"各单位明细/{dept_name}_明细.xlsx")
-        
-        # 添加原始打卡记录文件夹和拆分后的文件
-        for file_path in split_files:
-            if os.path.exists(file_path):
-                file_name = os.path.basename(file_path)
-                zipf.write(file_path, f"原始打卡记录/{file_name}")
+def create_zip_file(df_summary, df_all, split_files=(), progress=None):
+    """
+    在内存中生成全部下载内容（不写当前目录，各会话互不影响）
+    :param split_files: 拆分后的原始打卡记录文件路径，从磁盘压缩写入 ZIP
+    :return: {"zip": ZIP 内容, "summary": 汇总表内容, "detail": 明细表内容}
+    """
+    dept_summary, dept_detail = department_workbooks(df_summary, df_all)
+    workbooks = [("汇总表.xlsx", df_summary), ("明细表.xlsx", df_all)]
+    workbooks += [(f"各单位汇总/{name}_汇总.xlsx", group) for name, group in dept_summary]
+    workbooks += [(f"各单位明细/{name}_明细.xlsx", group) for name, group in dept_detail]
+    extra_files = [(f"原始打卡记录/{os.path.basename(path)}", path) for path in split_files]
+
+    buffer = io.BytesIO()
+    contents = write_results_zip(buffer, workbooks, extra_files, progress=progress)
+    return {
+        "zip": buffer.getvalue(),
+        "summary": contents["汇总表.xlsx"],
+        "detail": contents["明细表.xlsx"],
+    }
+
+# === 分析结果缓存（所有会话共享，会话状态中只保存输入指纹） ===
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+
+def get_cached_result(result_key):
+    """按输入指纹取分析结果；已被淘汰时返回 None"""
+    if result_key is None:
+        return None
+    hit, result = get_result_cache().get(result_key)
+    return result if hit else None
+
+
+def downloads_key(result_key):
+    return f"{result_key}:downloads"
+
+
+def save_downloads(result_key, downloads):
+    """
+    超过共享缓存上限的下载内容写入临时目录，会话状态中只保存 (输入指纹, 目录)
+    本会话之前写入的临时目录同时删除
+    """
+    discard_saved_downloads()
+    download_dir = tempfile.mkdtemp(prefix="attendance_downloads_")
+    for name, content in downloads.items():
+        with open(os.path.join(download_dir, name), "wb") as f:
+            f.write(content)
+    st.session_state.downloads_dir = (result_key, download_dir)
+
+
+def discard_saved_downloads():
+    """删除本会话写入临时目录的下载内容"""
+    _, download_dir = st.session_state.pop("downloads_dir", (None, None))
+    if download_dir is not None:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def get_downloads(result_key):
+    """
+    按输入指纹取下载内容：优先取共享缓存；超过缓存上限未能缓存的，从本会话的临时目录读取
+    :return: 下载内容，已被淘汰时返回 None
+    """
+    downloads = get_cached_result(downloads_key(result_key))
+    if downloads is not None:
+        return downloads
+    saved_key, download_dir = st.session_state.get("downloads_dir", (None, None))
+    if saved_key != result_key or not os.path.isdir(download_dir):
+        return None
+    downloads = {}
+    for name in os.listdir(download_dir):
+        with open(os.path.join(download_dir, name), "rb") as f:
+            downloads[name] = f.read()
+    return downloads
 
 # === 批量文件上传处理 ===
 def process_uploaded_files(uploaded_files):
-    files = {}
-    unmatched_files = []
-    
-    for file in uploaded_files:
-        file_name = file.name
-        matched = False
-        
-        for keyword, key in FILE_TYPE_MAPPING.items():
-            if keyword in file_name:
-                files[key] = file
-                matched = True
-                break
-        
-        if not matched:
-            unmatched_files.append(file_name)
-    
-    return files, unmatched_files
+    return match_input_files(uploaded_files)
 
 # 主界面布局
 col1, col2 = st.columns([2, 1])
@@ -203,8 +154,7 @@ if uploaded_files:
             st.write(f"- {file_name}")
     
     # 检查是否所有必需的文件都已上传
-    required_keys = ["person", "oa", "trip", "pc", "leave", "shift", "qj", "holiday", "record"]
-    missing_keys = [key for key in required_keys if key not in files]
+    missing_keys = [key for key in REQUIRED_KEYS if key not in files]
     
     if missing_keys:
         st.error(f"❌ 缺少以下必需文件：{', '.join(missing_keys)}")
@@ -214,16 +164,8 @@ if uploaded_files:
         # 初始化会话状态
         if 'analysis_completed' not in st.session_state:
             st.session_state.analysis_completed = False
-        if 'df_summary' not in st.session_state:
-            st.session_state.df_summary = None
-        if 'df_all' not in st.session_state:
-            st.session_state.df_all = None
-        if 'dept_summary_files' not in st.session_state:
-            st.session_state.dept_summary_files = []
-        if 'dept_detail_files' not in st.session_state:
-            st.session_state.dept_detail_files = []
-        if 'zip_file_created' not in st.session_state:
-            st.session_state.zip_file_created = False
+        if 'result_key' not in st.session_state:
+            st.session_state.result_key = None
         
         # 开始分析按钮
         if st.button("🚀 开始分析", key="start_analysis", help="点击开始处理考勤数据"):
@@ -231,96 +173,63 @@ if uploaded_files:
                 try:
                     start_time = time.time()
                     
-                    # 加载数据
-                    person_df = pd.read_excel(files["person"], dtype={"工号": str})
-                    oa_df = pd.read_excel(files["oa"], dtype={"编号": str})
-                    leave_df = pd.read_excel(files["leave"], dtype={"人员编码": str})
-                    qj_df = pd.read_excel(files["qj"], dtype={"工号": str})
-                    holiday_df = pd.read_excel(files["holiday"])
-                    holiday_set = set(pd.to_datetime(holiday_df["日期"]).dt.date)
-                    trip_df = pd.read_excel(files["trip"], dtype={"人员编号": str})
-
-                    if files["shift"].name.endswith(".xlsx"):
-                        shift_df = pd.read_excel(files["shift"], dtype={"工号": str})
+                    # 相同输入（文件名、内容、规则版本均一致）直接复用已有结果
+                    result_key = fingerprint_inputs(files, RULE_VERSION)
+                    result = get_cached_result(result_key)
+                    if result is None:
+                        result = run_pipeline(files, cache=InputCache())
+                        get_result_cache().put(result_key, result)
                     else:
-                        shift_df = pd.read_csv(files["shift"], encoding="gbk", dtype={"工号": str})
+                        st.info("♻️ 输入文件未变化，直接使用已缓存的分析结果")
+                    df_summary = result["df_summary"]
+                    df_all = result["df_all"]
 
-                    if files["record"].name.endswith(".csv"):
-                        record_df = pd.read_csv(files["record"], encoding="gbk", parse_dates=["考勤时间"], dtype={"工号": str})
-                    else:
-                        record_df = pd.read_excel(files["record"], dtype={"工号": str})
-
-                    # 处理PC考勤结果
-                    date_range, attendance_data = process_pc_attendance(files["pc"])
-                    contact_attendance_list, person_dept_dict = init_attendance_template(person_df, date_range[0], date_range[1])
-                    index_map = build_record_index(contact_attendance_list)
-
-                    fill_pc_attendance(index_map, attendance_data)
-                    fill_oa_attendance(index_map, oa_df)
-                    fill_leave_registration(index_map, leave_df)
-                    fill_leave_info(index_map, qj_df)
-                    fill_business_trip(index_map, trip_df)
-                    shift_day_dict = fill_shift_attendance(index_map, shift_df, record_df, holiday_set, person_dept_dict)
-
-                    # 汇总数据
-                    summary_result = summarize_attendance(contact_attendance_list, holiday_set, shift_day_dict)
-                    df_summary = pd.DataFrame(summary_result)
-                    df_all = pd.DataFrame(contact_attendance_list)
-
-                    # 清理数据
-                    df_summary = clean_zeros(df_summary)
-                    
-                    # 保存带颜色标记的汇总表
-                    save_excel_with_highlight(df_summary, "汇总表.xlsx")
-                    
-                    # 保存带颜色标记的明细表
-                    save_excel_with_highlight(df_all, "明细表.xlsx")
-                    
-                    # 准备部门文件列表
-                    dept_summary_files = []
-                    dept_detail_files = []
-                    
-                    # 按一级部门分组并保存文件
-                    if "部门" in df_summary.columns:
-                        # 按一级部门分组
-                        dept_groups_summary = df_summary.groupby(df_summary["部门"].astype(str).str.split("/").str[0])
-                        dept_groups_detail = df_all.groupby(df_all["部门"].astype(str).str.split("/").str[0])
-                        
-                        # 为每个部门保存文件
-                        for dept, group in dept_groups_summary:
-                            dept_name = str(dept).strip().replace("/", "_").replace("\\", "_")
-                            
-                            # 保存部门汇总表
-                            dept_summary_file = f"{dept_name}_汇总.xlsx"
-                            save_excel_with_highlight(group, dept_summary_file)
-                            dept_summary_files.append((dept_name, dept_summary_file))
-                            
-                            # 保存部门明细表
-                            dept_detail_file = f"{dept_name}_明细.xlsx"
-                            dept_detail_group = dept_groups_detail.get_group(dept)
-                            save_excel_with_highlight(dept_detail_group, dept_detail_file)
-                            dept_detail_files.append((dept_name, dept_detail_file))
-                    
-                    # 拆分原始打卡记录
-                    split_files = split_attendance_records(files["record"], "原始打卡记录")
-                    
-                    # 创建ZIP文件
-                    create_zip_file("考勤结果汇总.zip", "汇总表.xlsx", "明细表.xlsx", dept_summary_files, dept_detail_files, split_files)
-                    
-                    # 更新会话状态
+                    # 生成下载内容（同一输入只生成一次，所有会话共用）
+                    if get_downloads(result_key) is None:
+                        # 清理数据
+                        df_summary = clean_zeros(df_summary)
+
+                        # 拆分原始打卡记录到临时目录，写入 ZIP 后删除
+                        with tempfile.TemporaryDirectory(prefix="attendance_split_") as split_dir:
+                            split_files = split_attendance_records(files["record"], split_dir)
+
+                            export_bar = st.progress(0.0, text="💾 正在生成结果文件...")
+                            downloads = create_zip_file(
+                                df_summary, df_all, split_files,
+                                progress=lambda done, total, name: export_bar.progress(
+                                    done / total, text=f"💾 正在生成结果文件 {done}/{total}：{name}"),
+                            )
+                            export_bar.empty()
+                        if get_result_cache().put(downloads_key(result_key), downloads):
+                            discard_saved_downloads()
+                        else:
+                            # 超过共享缓存上限：写入临时文件，避免刚生成的结果无法下载，也不占用会话内存
+                            save_downloads(result_key, downloads)
+
+                    # 更新会话状态（只保存输入指纹）
                     st.session_state.analysis_completed = True
-                    st.session_state.df_summary = df_summary
-                    st.session_state.df_all = df_all
-                    st.session_state.dept_summary_files = dept_summary_files
-                    st.session_state.dept_detail_files = dept_detail_files
-                    st.session_state.split_files = split_files
-                    st.session_state.zip_file_created = True
+                    st.session_state.result_key = result_key
                     
                     # 显示处理结果
                     st.success("✅ 考勤数据处理完成！")
-                    st.write(f"📊 处理了 {len(contact_attendance_list)} 条考勤记录")
+                    st.write(f"📊 处理了 {result['record_count']} 条考勤记录")
                     st.write(f"👥 涉及 {len(set(df_all['工号']))} 位员工")
                     st.write(f"⏱️ 用时 {time.time() - start_time:.2f} 秒")
+
+                    # 运行统计：各阶段耗时、CPU 时间、行数、未匹配记录与峰值内存
+                    with st.expander("📈 运行统计"):
+                        st.write(summary_text(result["timings"]))
+                        st.dataframe(result["timings"], use_container_width=True)
+                        for source, item in result["unmatched_ids"].items():
+                            st.warning(f"{source}：{item['count']} 个工号不在通信录中，如 {', '.join(item['examples'])}")
+                        report = format_timings(result["timings"])
+                        report["unmatched_ids"] = result["unmatched_ids"]
+                        st.download_button(
+                            label="📥 下载运行记录（JSON）",
+                            data=json.dumps(report, ensure_ascii=False, indent=2, default=str),
+                            file_name="运行记录.json",
+                            mime="application/json"
+                        )
                     
                 except Exception as e:
                     st.error(f"❌ 处理过程中出现错误：{str(e)}")
@@ -328,73 +237,47 @@ if uploaded_files:
         
         # 如果分析已完成，显示下载按钮
         if st.session_state.analysis_completed:
-            # 提供下载链接
-            st.subheader("💾 下载结果")
-            
-            # 提供下载整个结果的按钮
-            if os.path.exists("考勤结果汇总.zip"):
-                with open("考勤结果汇总.zip", "rb") as f:
-                    st.download_button(
-                        label="📥 下载整个结果（ZIP格式）",
-                        data=f,
-                        file_name="考勤结果汇总.zip",
-                        mime="application/zip"
-                    )
-            
-            # 提供下载汇总表和明细表的按钮
-            if os.path.exists("汇总表.xlsx"):
-                with open("汇总表.xlsx", "rb") as f:
-                    st.download_button(
-                        label="📥 下载汇总表",
-                        data=f,
-                        file_name="所有单位汇总表.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            
-            if os.path.exists("明细表.xlsx"):
-                with open("明细表.xlsx", "rb") as f:
-                    st.download_button(
-                        label="📥 下载明细表",
-                        data=f,
-                        file_name="所有单位明细表.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            
-            # 清理临时文件按钮
-            if st.button("🗑️ 清理临时文件", key="clean_temp_files"):
-                # 清理部门文件
-                for dept_name, file_path in st.session_state.dept_summary_files:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                
-                for dept_name, file_path in st.session_state.dept_detail_files:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                
-                # 清理汇总表和明细表
-                if os.path.exists("汇总表.xlsx"):
-                    os.remove("汇总表.xlsx")
-                
-                if os.path.exists("明细表.xlsx"):
-                    os.remove("明细表.xlsx")
-                
-                # 清理ZIP文件
-                if os.path.exists("考勤结果汇总.zip"):
-                    os.remove("考勤结果汇总.zip")
-                
-                # 重置会话状态
+            downloads = get_downloads(st.session_state.result_key)
+            if downloads is None:
                 st.session_state.analysis_completed = False
-                st.session_state.df_summary = None
-                st.session_state.df_all = None
-                st.session_state.dept_summary_files = []
-                st.session_state.dept_detail_files = []
-                st.session_state.split_files = []
-                st.session_state.zip_file_created = False
-                
-                st.success("✅ 临时文件已清理完成！")
-                
-                # 刷新页面
-                st.rerun()
+                st.session_state.result_key = None
+                st.warning("⚠️ 结果已过期，请重新点击“开始分析”")
+            else:
+                # 提供下载链接
+                st.subheader("💾 下载结果")
+
+                # 提供下载整个结果的按钮
+                st.download_button(
+                    label="📥 下载整个结果（ZIP格式）",
+                    data=downloads["zip"],
+                    file_name="考勤结果汇总.zip",
+                    mime="application/zip"
+                )
+
+                # 提供下载汇总表和明细表的按钮
+                st.download_button(
+                    label="📥 下载汇总表",
+                    data=downloads["summary"],
+                    file_name="所有单位汇总表.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
+                st.download_button(
+                    label="📥 下载明细表",
+                    data=downloads["detail"],
+                    file_name="所有单位明细表.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+
+                # 清除结果按钮（超过缓存上限而写入临时文件的结果同时删除）
+                if st.button("🗑️ 清除结果", key="clean_temp_files"):
+                    st.session_state.analysis_completed = False
+                    st.session_state.result_key = None
+                    discard_saved_downloads()
+                    st.success("✅ 结果已清除！")
+
+                    # 刷新页面
+                    st.rerun()
 
 # 侧边栏信息
 with st.sidebar: